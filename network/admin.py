@@ -7,6 +7,6 @@ from .models import *
 admin.site.register(User)
 admin.site.register(Post)
 admin.site.register(Comment)
-admin.site.register(Follower)
+admin.site.register(Follow)
 #admin.site.register(Like)
 #admin.site.register(Saved)
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+Admission control for the write endpoints.
+
+Every write passes three checks before its view runs:
+
+    1. a token bucket per user (WRITE_RATE_USER per second, bursts of
+       WRITE_BURST_USER), answered with 429 when empty;
+    2. a token bucket for the whole process (WRITE_RATE_GLOBAL and
+       WRITE_BURST_GLOBAL), answered with 503 when empty;
+    3. at most WRITE_CONCURRENCY writes in flight, with up to WRITE_QUEUE more
+       waiting for WRITE_QUEUE_TIMEOUT seconds; past that, 503.
+
+Rejections are immediate and carry Retry-After, so a spike is turned away
+at the door instead of piling up behind the database writer and slowing
+every read down with it. A write that still times out waiting for a
+database lock gets the same 503 instead of a bare 500.
+
+The limits are per process: with several workers the global ones add up.
+"""
+import asyncio
+import math
+import threading
+from collections import OrderedDict
+from functools import wraps
+from time import monotonic
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import OperationalError
+from django.http import HttpResponse
+
+
+# Most per-user buckets kept; the least recently used are dropped first.
+MAX_USER_BUCKETS = 10000
+POLL_INTERVAL = 0.01
+
+# PostgreSQL: lock_not_available, query_canceled (statement_timeout),
+# serialization_failure and deadlock_detected.
+BUSY_SQLSTATES = {'55P03', '57014', '40001', '40P01'}
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    def take(self):
+        """Take a token: return 0 if one was available, else the seconds until there is one."""
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Gate:
+    """A counting semaphore with a bounded number of waiters, for threads and coroutines alike."""
+
+    def __init__(self, slots, queue):
+        self.slots = slots
+        self.queue = queue
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def _try_enter(self):
+        if self.active < self.slots:
+            self.active += 1
+            return True
+        return False
+
+    def enter(self, timeout):
+        with self.condition:
+            if self._try_enter():
+                return True
+            if self.waiting >= self.queue:
+                return False
+            self.waiting += 1
+            try:
+                return self.condition.wait_for(self._try_enter, timeout)
+            finally:
+                self.waiting -= 1
+
+    async def aenter(self, timeout):
+        with self.condition:
+            if self._try_enter():
+                return True
+            if self.waiting >= self.queue:
+                return False
+            self.waiting += 1
+        deadline = monotonic() + timeout
+        try:
+            while monotonic() < deadline:
+                await asyncio.sleep(POLL_INTERVAL)
+                with self.condition:
+                    if self._try_enter():
+                        return True
+            return False
+        finally:
+            with self.condition:
+                self.waiting -= 1
+
+    def leave(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+
+class Limits:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = OrderedDict()
+        self.everyone = TokenBucket(settings.WRITE_RATE_GLOBAL, settings.WRITE_BURST_GLOBAL)
+        self.gate = Gate(settings.WRITE_CONCURRENCY, settings.WRITE_QUEUE)
+
+    def check(self, user_id):
+        """Return None to admit a write, or the response turning it away."""
+        with self.lock:
+            bucket = self.users.get(user_id)
+            if bucket is None:
+                bucket = self.users[user_id] = TokenBucket(settings.WRITE_RATE_USER, settings.WRITE_BURST_USER)
+                if len(self.users) > MAX_USER_BUCKETS:
+                    self.users.popitem(last=False)
+            else:
+                self.users.move_to_end(user_id)
+            wait = bucket.take()
+            if wait:
+                return rejected(429, "Too many requests", wait)
+            wait = self.everyone.take()
+            if wait:
+                return rejected(503, "Server busy", wait)
+        return None
+
+
+_limits = None
+_limits_lock = threading.Lock()
+
+
+def limits():
+    global _limits
+    if _limits is None:
+        with _limits_lock:
+            if _limits is None:
+                _limits = Limits()
+    return _limits
+
+
+def rejected(status, message, retry_after):
+    response = HttpResponse(f"{message}, retry later", status=status)
+    response['Retry-After'] = max(1, math.ceil(retry_after))
+    return response
+
+
+def is_busy(error):
+    """True for database errors that mean "overloaded, try again", not "broken"."""
+    if not isinstance(error, OperationalError):
+        return False
+    if getattr(error.__cause__, 'sqlstate', None) in BUSY_SQLSTATES:
+        return True
+    return 'database is locked' in str(error) or 'database table is locked' in str(error)
+
+
+def error_response(error):
+    """The response for an unexpected error in a write view."""
+    if is_busy(error):
+        return rejected(503, "Server busy", settings.WRITE_QUEUE_TIMEOUT)
+    return HttpResponse(str(error), status=500)
+
+
+def limit_writes(view):
+    """Apply the write limits to a view's POST, PUT and DELETE requests."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def admit(request, *args, **kwargs):
+            if request.method in ('GET', 'HEAD', 'OPTIONS') or not settings.WRITE_ADMISSION:
+                return await view(request, *args, **kwargs)
+            user = await request.auser()
+            if not user.is_authenticated:
+                return await view(request, *args, **kwargs)
+            current = limits()
+            if response := current.check(user.pk):
+                return response
+            if not await current.gate.aenter(settings.WRITE_QUEUE_TIMEOUT):
+                return rejected(503, "Server busy", settings.WRITE_QUEUE_TIMEOUT)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                current.gate.leave()
+    else:
+        @wraps(view)
+        def admit(request, *args, **kwargs):
+            if request.method in ('GET', 'HEAD', 'OPTIONS') or not settings.WRITE_ADMISSION:
+                return view(request, *args, **kwargs)
+            if not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            current = limits()
+            if response := current.check(request.user.pk):
+                return response
+            if not current.gate.enter(settings.WRITE_QUEUE_TIMEOUT):
+                return rejected(503, "Server busy", settings.WRITE_QUEUE_TIMEOUT)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                current.gate.leave()
+    return admit
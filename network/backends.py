@@ -0,0 +1,37 @@
+"""
+An authentication backend that keeps users in the cache.
+
+AuthenticationMiddleware loads the signed-in user on every request. With
+AUTH_USER_CACHE_TTL above zero, CachedModelBackend serves that lookup from
+the cache and only reads `network_user` on a miss. A user's entry is dropped
+when their row is saved or deleted (see network.signals). Counters changed
+with queryset updates, such as follower_count, may lag by up to the TTL, so
+code that acts on them reads them from the database instead (see
+network.timeline.is_celebrity).
+
+The cache must be shared by all workers (CACHE_URL), or a password change
+would only end the old sessions on the worker that made it.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget(user_id):
+    cache.delete(user_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not settings.AUTH_USER_CACHE_TTL:
+            return super().get_user(user_id)
+        user = cache.get(user_key(user_id))
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(user_key(user_id), user, settings.AUTH_USER_CACHE_TTL)
+        return user
@@ -0,0 +1,127 @@
+"""
+Content-addressed, deduplicated media storage.
+
+ContentAddressedStorage stores every file under the SHA-256 digest of its
+content, sharded two levels deep: `blobs/ab/cd/abcd…ef.jpg`. The same image
+uploaded twice, or resized to the same bytes, is stored once, no directory
+grows past a few hundred entries, and the names never change meaning, so
+network.media serves them as immutable.
+
+Each Blob row counts the references to one file. Saving a file adds one;
+deleting it through the storage, or releasing the names an image field and
+its derivatives hold (on post and user deletion and image replacement),
+removes one. Once the transaction commits, blobs left without references are
+deleted along with their files. The `collect_media` command catches up on
+anything missed, such as files written by transactions that rolled back.
+
+Files saved before this storage keep their names and are deleted outright
+when released, since only one row ever refers to them.
+"""
+import hashlib
+import logging
+import os
+import re
+from functools import partial
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Blob
+
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = 'blobs'
+BLOB_NAME = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def blob_name(digest, extension):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def is_blob(name):
+    return bool(name) and BLOB_NAME.match(name) is not None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = blob_name(digest.hexdigest(), os.path.splitext(name)[1].lower())
+
+        with transaction.atomic():
+            if Blob.objects.filter(name=name).update(refs=F('refs') + 1):
+                return name
+            try:
+                with transaction.atomic():
+                    Blob.objects.create(name=name, size=content.size, refs=1)
+            except IntegrityError:
+                # Created by a concurrent save of the same content.
+                Blob.objects.filter(name=name).update(refs=F('refs') + 1)
+                return name
+            # Holding the new row keeps collect() from removing the file while it is written.
+            self.remove(name)
+            return super()._save(name, content)
+
+    def delete(self, name):
+        release([name])
+
+    def remove(self, name):
+        """Delete the file itself, whatever refers to it."""
+        super().delete(name)
+
+
+def references(instance, field_name):
+    """The stored names `instance.<field_name>` refers to: the file and its derivatives."""
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return []
+    names = [field_file.name]
+    info = getattr(instance, f'{field_name}_variants') or {}
+    if info.get('source') == field_file.name:
+        names += [variant['name'] for variant in info.get('variants', [])]
+    return names
+
+
+def release(names):
+    """Drop one reference to each of `names`; files left unreferenced go once the transaction commits."""
+    blobs = [name for name in names if is_blob(name)]
+    for name in blobs:
+        Blob.objects.filter(name=name, refs__gt=0).update(refs=F('refs') - 1, released_at=timezone.now())
+    legacy = [name for name in names if name and not is_blob(name)]
+    transaction.on_commit(partial(_collect_released, blobs, legacy))
+
+
+def _collect_released(blobs, legacy):
+    try:
+        collect(blobs)
+        for name in legacy:
+            default_storage.remove(name)
+    except Exception:
+        logger.exception("Could not delete released media %s", blobs + legacy)
+
+
+def collect(names=None, released_before=None):
+    """Delete unreferenced blobs (among `names`, if given) and their files; return how many."""
+    orphans = Blob.objects.filter(refs__lte=0)
+    if names is not None:
+        orphans = orphans.filter(name__in=names)
+    if released_before is not None:
+        orphans = orphans.filter(released_at__lt=released_before)
+    removed = 0
+    for name in orphans.values_list('name', flat=True):
+        with transaction.atomic():
+            # Deleting the row first makes a concurrent save of the same
+            # content wait, then write the file again.
+            if Blob.objects.filter(name=name, refs__lte=0).delete()[0]:
+                default_storage.remove(name)
+                removed += 1
+    return removed
@@ -0,0 +1,72 @@
+"""
+Conditional GET for the feed pages and the comments JSON.
+
+Each view first computes a validator from a narrow query (the keys and
+versions of the posts on the page with their authors' names and avatars, or
+a post's comment count, latest comment time and the commenters on the page)
+and answers If-None-Match / If-Modified-Since with 304 before running the
+feed query or rendering. The ETag also covers who is asking and how they
+are shown in the sidebar, their CSRF cookie (the page embeds a token derived
+from it) and the deployed templates, and responses are marked
+`private, no-cache` so that browsers revalidate every time and shared caches
+keep nothing.
+"""
+import hashlib
+import os
+
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+# Pages embed the URLs of static files, which change with their content.
+DEPLOYED_DIRS = [os.path.join(os.path.dirname(__file__), name) for name in ('templates', 'static')]
+
+_deployed = None
+
+
+def deployed():
+    """Latest modification time of the app's templates and static files: a new deploy changes every page."""
+    global _deployed
+    if _deployed is None:
+        _deployed = max(
+            (
+                os.stat(os.path.join(root, name)).st_mtime_ns
+                for directory in DEPLOYED_DIRS for root, _, names in os.walk(directory) for name in names
+            ),
+            default=0,
+        )
+    return _deployed
+
+
+def shown(user, *fields):
+    """The displayed fields of `user`, and any other `fields`, as validator parts."""
+    return tuple(str(getattr(user, field)) for field in user.DISPLAY_FIELDS + fields)
+
+
+def etag(request, viewer, *parts):
+    # get_token() picks the CSRF secret this response will set if the request had none.
+    get_token(request)
+    viewer_shown = shown(viewer) if viewer.is_authenticated else None
+    data = repr((deployed(), viewer.pk, viewer_shown, request.META['CSRF_COOKIE'], parts))
+    return 'W/"%s"' % hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+def not_modified(request, validator, last_modified=None):
+    """A 304 response if the client's copy matches, else None."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(
+        request, etag=validator, last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        tag(response, validator, last_modified)
+    return response
+
+
+def tag(response, validator, last_modified=None):
+    response.headers['ETag'] = validator
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
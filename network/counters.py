@@ -0,0 +1,51 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User
+
+
+def count_of(model, field):
+    """A subquery counting the `model` rows whose `field` is the outer row."""
+    rows = (
+        model.objects
+        .filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return Coalesce(Subquery(rows), 0)
+
+
+def reconcile(batch_size=10000):
+    """
+    Recompute every counter column from the rows it counts, one primary key
+    range at a time so no single UPDATE holds the table for long. Only rows
+    with a wrong counter are written; returns how many per model.
+    """
+    targets = [
+        (Post, {
+            'like_count': count_of(Post.likers.through, 'post'),
+            'save_count': count_of(Post.savers.through, 'post'),
+            'comment_count': count_of(Comment, 'post'),
+        }, {
+            # Corrected counts change the feed cards.
+            'version': F('version') + 1,
+        }),
+        (User, {
+            'follower_count': count_of(Follow, 'followee'),
+            'following_count': count_of(Follow, 'follower'),
+            'post_count': count_of(Post, 'creater'),
+        }, {}),
+    ]
+    updated = {}
+    for model, counters, changes in targets:
+        wrong = Q()
+        for field, count in counters.items():
+            wrong |= ~Q(**{field: count})
+        last = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        updated[model.__name__] = 0
+        for start in range(0, last + 1, batch_size):
+            rows = model.objects.filter(wrong, pk__gte=start, pk__lt=start + batch_size)
+            updated[model.__name__] += rows.update(**counters, **changes)
+    return updated
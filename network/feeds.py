@@ -0,0 +1,50 @@
+from django.db.models import Exists, OuterRef, Value
+from django.utils.dateformat import format as format_date
+from django.utils.timezone import localtime
+
+from . import images
+from .models import Post, User
+
+
+def card_fields(relation='creater'):
+    """
+    What a card shows that its row's version does not cover: lookups of the
+    displayed fields of the user reached through `relation` (the author, or
+    a commenter), for page fingerprints.
+    """
+    return tuple(f'{relation}__{field}' for field in User.DISPLAY_FIELDS)
+
+
+def feed_queryset(viewer, posts=None):
+    """
+    Return `posts` (all posts by default) ready for rendering as feed cards:
+    the creator is joined in and the viewer's liked/saved flags are computed
+    in the same SQL statement instead of per card.
+    """
+    if posts is None:
+        posts = Post.objects.all()
+    posts = posts.select_related('creater')
+
+    if viewer is not None and viewer.is_authenticated:
+        return posts.annotate(
+            liked=Exists(Post.likers.through.objects.filter(post=OuterRef('pk'), user=viewer.pk)),
+            saved=Exists(Post.savers.through.objects.filter(post=OuterRef('pk'), user=viewer.pk)),
+        )
+    return posts.annotate(liked=Value(False), saved=Value(False))
+
+
+def serialize_post(post, viewer=None):
+    """The JSON form of a feed card, for a post from feed_queryset()."""
+    return {
+        "id": post.id,
+        "creater": post.creater.serialize(),
+        "text": post.content_text,
+        "timestamp": format_date(localtime(post.date_created), "P M d Y"),
+        "like_count": post.like_count,
+        "comment_count": post.comment_count,
+        "liked": post.liked,
+        "saved": post.saved,
+        "own": viewer is not None and post.creater_id == viewer.pk,
+        "image": images.pick(post.content_image, post.content_image_variants, 640) or None,
+        "image_large": images.pick(post.content_image, post.content_image_variants, 1280) or None,
+    }
@@ -0,0 +1,51 @@
+"""
+Operations on the follow graph. Each one is a single indexed query against
+the Follow edge table.
+"""
+from django.db import IntegrityError, transaction
+
+from .models import Follow, User
+
+
+def follow(follower, followee):
+    """Add the edge and return True, or False if it already existed."""
+    try:
+        with transaction.atomic():
+            Follow.objects.create(follower=follower, followee=followee)
+    except IntegrityError:
+        return False
+    return True
+
+
+def unfollow(follower, followee):
+    """Remove the edge and return True, or False if there was none."""
+    deleted, _ = Follow.objects.filter(follower=follower, followee=followee).delete()
+    return bool(deleted)
+
+
+def follow_many(follower, followees):
+    Follow.objects.bulk_create([Follow(follower=follower, followee=followee) for followee in followees])
+
+
+def unfollow_many(follower, followees):
+    Follow.objects.filter(follower=follower, followee__in=followees).delete()
+
+
+def is_following(follower, followee):
+    return Follow.objects.filter(follower=follower, followee=followee).exists()
+
+
+def follower_ids(user):
+    return Follow.objects.filter(followee=user).values_list('follower', flat=True)
+
+
+def followee_ids(user):
+    return Follow.objects.filter(follower=user).values_list('followee', flat=True)
+
+
+def followers_of(user):
+    return User.objects.filter(following_edges__followee=user).order_by('-following_edges__created_at')
+
+
+def followed_by(user):
+    return User.objects.filter(follower_edges__follower=user).order_by('-follower_edges__created_at')
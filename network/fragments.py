@@ -0,0 +1,117 @@
+"""
+Cached HTML fragments of the feed post cards.
+
+The parts of a card that look the same to every viewer (the author's avatar
+and byline, the text and the image) are rendered once and kept under a key
+made of the post's id and version, a digest of the author's displayed
+fields and the deployed templates. Post.version is bumped by every edit,
+like and comment, and any change to the author's name or picture changes
+the digest, so an outdated fragment is never looked up again and there is
+nothing to delete. Deleted posts are simply never asked for.
+
+Lookups go to a small LRU in the process first, then, for a whole page at
+once, to the Django cache; only the misses are rendered. The viewer's own
+state (liked, saved, the owner's menu, the comment form) stays in the
+template and is rendered on every request.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .conditional import deployed
+
+
+TEMPLATE = 'network/post_card_fragments.html'
+# Separates the parts in the rendered TEMPLATE.
+SEPARATOR = '<!-- fragment -->'
+PARTS = ('avatar', 'byline', 'content')
+
+
+class LRU:
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if not self.size:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def local():
+    global _local
+    if _local is None:
+        with _local_lock:
+            if _local is None:
+                _local = LRU(settings.CARD_CACHE_LRU_SIZE)
+    return _local
+
+
+def key(post):
+    author = post.creater
+    shown = repr((
+        author.username, author.first_name, author.last_name,
+        author.profile_pic.name or '', author.profile_pic_variants, deployed(),
+    ))
+    # The creation time guards against ids that come back after a rollback.
+    return 'card:%d:%d:%d:%s' % (
+        post.pk, post.version, post.date_created.timestamp() * 1e6,
+        hashlib.blake2b(shown.encode(), digest_size=8).hexdigest(),
+    )
+
+
+def render(post):
+    parts = render_to_string(TEMPLATE, {'post': post}).split(SEPARATOR)
+    return {part: html.strip() for part, html in zip(PARTS, parts)}
+
+
+def attach(posts):
+    """
+    Set `card` on each post of a feed page to a dict of its cached fragments,
+    rendering and storing those missing from both caches.
+    """
+    if not settings.CARD_CACHE:
+        for post in posts:
+            post.card = {part: mark_safe(html) for part, html in render(post).items()}
+        return
+    keys = {post.pk: key(post) for post in posts}
+    found = {}
+    for post in posts:
+        fragments = local().get(keys[post.pk])
+        if fragments is not None:
+            found[keys[post.pk]] = fragments
+    missing = [keys[post.pk] for post in posts if keys[post.pk] not in found]
+    if missing:
+        shared = cache.get_many(missing)
+        rendered = {
+            keys[post.pk]: render(post) for post in posts
+            if keys[post.pk] in missing and keys[post.pk] not in shared
+        }
+        if rendered:
+            cache.set_many(rendered, settings.CARD_CACHE_TTL)
+        for card_key, fragments in {**shared, **rendered}.items():
+            local().set(card_key, fragments)
+            found[card_key] = fragments
+    for post in posts:
+        post.card = {part: mark_safe(html) for part, html in found[keys[post.pk]].items()}
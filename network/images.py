@@ -0,0 +1,187 @@
+"""
+Resized, re-encoded derivatives of uploaded images.
+
+After a post image, profile picture or cover is uploaded, a background
+thread decodes it once and writes WebP (or JPEG) copies at the widths listed
+in IMAGE_DERIVATIVE_WIDTHS. Derivative names carry a digest of their content,
+so they can be cached forever. Names and dimensions are stored next to the
+image in its `<field>_variants` JSON column, so templates can pick a small
+copy without touching the filesystem or running extra queries.
+
+The upload itself is replaced by a re-encoded copy without its metadata
+(EXIF, including any location, and comments), turned upright. Animated
+images and GIFs are kept as uploaded.
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from PIL import Image, ImageOps, features
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def _output_format():
+    fmt = settings.IMAGE_DERIVATIVE_FORMAT.upper()
+    if fmt == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return fmt
+
+
+def _encode(image, fmt, quality=None, **options):
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if image.mode == 'RGBA' else None)
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, fmt, quality=quality or settings.IMAGE_DERIVATIVE_QUALITY, optimize=True, **options)
+    return buffer.getvalue()
+
+
+# Upload formats re-encoded without metadata, with the extension to use.
+STRIPPED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+
+def render_variants(field_file, widths, strip=False):
+    """
+    Decode `field_file` and return (width, height, variants, original), where
+    each variant is a (width, height, encoded bytes, extension) tuple. Only
+    widths narrower than the original are produced; animated images get none.
+    With `strip`, `original` is an (encoded bytes, extension) copy of the
+    image without its metadata, or None if the image is kept as it is.
+    """
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        animated = getattr(image, 'is_animated', False)
+        source_format = image.format
+        icc_profile = image.info.get('icc_profile')
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.mode in ('LA', 'P', 'PA') else 'RGB')
+
+    fmt = _output_format()
+    extension = 'jpg' if fmt == 'JPEG' else fmt.lower()
+    variants = []
+    original = None
+    if not animated:
+        for width in sorted(widths):
+            if width >= image.width:
+                break
+            height = max(round(image.height * width / image.width), 1)
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            variants.append((width, height, _encode(resized, fmt), extension))
+        if strip and source_format in STRIPPED_FORMATS:
+            # Only the colour profile is carried over.
+            data = _encode(image, source_format, settings.IMAGE_ORIGINAL_QUALITY, icc_profile=icc_profile)
+            original = (data, STRIPPED_FORMATS[source_format])
+    return image.width, image.height, variants, original
+
+
+def generate(model, pk, field_name):
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return None
+
+    source = field_file.name
+    previous = getattr(instance, variants_field(field_name)) or {}
+    # Stripped copies are only made once, not every time derivatives are regenerated.
+    strip = not (previous.get('source') == source and previous.get('stripped'))
+    width, height, rendered, original = render_variants(field_file, settings.IMAGE_DERIVATIVE_WIDTHS[field_name], strip)
+    directory, filename = os.path.split(source)
+    stem = os.path.splitext(filename)[0]
+    variants = []
+    for variant_width, variant_height, data, extension in rendered:
+        name = default_storage.save(
+            os.path.join(directory, 'derivatives', f'{stem}_{variant_width}.{hashlib.sha256(data).hexdigest()[:16]}.{extension}'),
+            ContentFile(data),
+        )
+        variants.append({'width': variant_width, 'height': variant_height, 'name': name})
+
+    info = {'source': source, 'width': width, 'height': height, 'variants': variants, 'stripped': not strip}
+    changes = {variants_field(field_name): info}
+    created = [variant['name'] for variant in variants]
+    if original is not None:
+        data, extension = original
+        info['source'] = default_storage.save(
+            os.path.join(directory, f'{stem}.{hashlib.sha256(data).hexdigest()[:16]}.{extension}'), ContentFile(data),
+        )
+        info['stripped'] = True
+        changes[field_name] = info['source']
+        created.append(info['source'])
+    if model._meta.label == 'network.Post':
+        # Feed cards use the derivatives, so the card has changed.
+        changes['version'] = F('version') + 1
+    updated = model.objects.filter(pk=pk, **{field_name: source}).update(**changes)
+    if updated and model._meta.label == 'network.User':
+        # Imported here: network.backends needs the models, which import this module.
+        from .backends import forget
+
+        # update() sends no signal, so drop the cached signed-in user here.
+        forget(pk)
+    if updated:
+        # Derivatives of a replaced image were released along with it.
+        stale = [variant['name'] for variant in previous.get('variants', [])] if previous.get('source') == source else []
+        if original is not None:
+            stale.append(source)
+    else:
+        # The image was replaced while we worked, so our copies are stale.
+        stale = created
+    for name in stale:
+        default_storage.delete(name)
+    return info if updated else None
+
+
+def _run(model, pk, field_name):
+    close_old_connections()
+    try:
+        generate(model, pk, field_name)
+    except Exception:
+        logger.exception("Could not generate derivatives for %s %s.%s", model.__name__, pk, field_name)
+    finally:
+        close_old_connections()
+
+
+def schedule(instance, field_name):
+    """Generate derivatives for `instance.<field_name>` once the current transaction commits."""
+    global _executor
+    if not getattr(instance, field_name):
+        return
+    model, pk = type(instance), instance.pk
+    if settings.IMAGE_DERIVATIVES_EAGER:
+        transaction.on_commit(lambda: generate(model, pk, field_name))
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS, thread_name_prefix='derivatives')
+    transaction.on_commit(lambda: _executor.submit(_run, model, pk, field_name))
+
+
+def pick(field_file, info, width):
+    """
+    Return the URL of the smallest derivative of `field_file` at least
+    `width` pixels wide, falling back to the original.
+    """
+    if not field_file:
+        return ''
+    if info and info.get('source') == field_file.name:
+        for variant in info['variants']:
+            if variant['width'] >= width:
+                return default_storage.url(variant['name'])
+    return field_file.url
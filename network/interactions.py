@@ -0,0 +1,245 @@
+"""
+Write paths for posts, likes, saves, comments and follows.
+
+Every operation keeps the denormalized counter columns (Post.like_count,
+Post.save_count, Post.comment_count, User.follower_count,
+User.following_count and User.post_count) in step with the rows it changes,
+using F() expressions in the same transaction so concurrent writers never
+lose an update.
+
+The `a`-prefixed variants are for async views. Django's async ORM cannot
+open a transaction yet, so each of them runs the whole unit of work in a
+worker thread.
+"""
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef
+
+from . import follows, images, suggestions, timeline
+from .feeds import feed_queryset
+from .models import Comment, Follow, Post, User
+
+
+# Batch toggle actions: the post relation they change and the resulting state.
+POST_TOGGLES = {
+    'like': ('likers', True),
+    'unlike': ('likers', False),
+    'save': ('savers', True),
+    'unsave': ('savers', False),
+}
+POST_COUNTERS = {'likers': 'like_count', 'savers': 'save_count'}
+FOLLOW_TOGGLES = {'follow': True, 'unfollow': False}
+# Largest primary key a 64-bit integer column holds; past it the database rejects the parameter.
+MAX_ID = 2 ** 63 - 1
+
+
+def _add_to_post(relation, counter, post_id, user):
+    try:
+        with transaction.atomic():
+            if not Post.objects.filter(pk=post_id).update(**{counter: F(counter) + 1}, version=F('version') + 1):
+                raise Post.DoesNotExist
+            relation.through.objects.create(post_id=post_id, user_id=user.pk)
+    except IntegrityError:
+        # Already there: the transaction rolled the counter back.
+        return False
+    return True
+
+
+def _remove_from_post(relation, counter, post_id, user):
+    with transaction.atomic():
+        deleted, _ = relation.through.objects.filter(post_id=post_id, user_id=user.pk).delete()
+        if deleted:
+            Post.objects.filter(pk=post_id).update(**{counter: F(counter) - 1}, version=F('version') + 1)
+        elif not Post.objects.filter(pk=post_id).exists():
+            raise Post.DoesNotExist
+    return bool(deleted)
+
+
+def like(user, post_id):
+    return _add_to_post(Post.likers, 'like_count', post_id, user)
+
+
+def unlike(user, post_id):
+    return _remove_from_post(Post.likers, 'like_count', post_id, user)
+
+
+def save(user, post_id):
+    return _add_to_post(Post.savers, 'save_count', post_id, user)
+
+
+def unsave(user, post_id):
+    return _remove_from_post(Post.savers, 'save_count', post_id, user)
+
+
+def follow(user, target):
+    with transaction.atomic():
+        created = follows.follow(user, target)
+        if created:
+            User.objects.filter(pk=target.pk).update(follower_count=F('follower_count') + 1)
+            User.objects.filter(pk=user.pk).update(following_count=F('following_count') + 1)
+    if created:
+        timeline.backfill(user, target)
+        suggestions.invalidate(user)
+    return created
+
+
+def unfollow(user, target):
+    demoted = []
+    with transaction.atomic():
+        deleted = follows.unfollow(user, target)
+        if deleted:
+            User.objects.filter(pk=target.pk).update(follower_count=F('follower_count') - 1)
+            User.objects.filter(pk=user.pk).update(following_count=F('following_count') - 1)
+            demoted = timeline.demoted([target.pk])
+    if deleted:
+        timeline.prune(user, target)
+        for author in demoted:
+            timeline.refill(author)
+        suggestions.invalidate(user)
+    return deleted
+
+
+def create_post(user, text, image):
+    with transaction.atomic():
+        post = Post.objects.create(creater=user, content_text=text, content_image=image)
+        User.objects.filter(pk=user.pk).update(post_count=F('post_count') + 1)
+        images.schedule(post, 'content_image')
+    timeline.fan_out(post)
+    return post
+
+
+def delete_post(post):
+    with transaction.atomic():
+        post.delete()
+        User.objects.filter(pk=post.creater_id).update(post_count=F('post_count') - 1)
+
+
+def add_comment(user, post_id, text):
+    with transaction.atomic():
+        if not Post.objects.filter(pk=post_id).update(comment_count=F('comment_count') + 1, version=F('version') + 1):
+            raise Post.DoesNotExist
+        return Comment.objects.create(post_id=post_id, commenter=user, comment_content=text)
+
+
+def _coalesce(operations):
+    """
+    Reduce a list of toggles to the final state wanted for each target:
+    ({(relation, post_id): state}, {username: state}). Raises ValueError for
+    anything malformed.
+    """
+    posts, users = {}, {}
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise ValueError("Each operation must be an object")
+        action = operation.get('action')
+        if action in POST_TOGGLES:
+            relation, state = POST_TOGGLES[action]
+            post_id = operation.get('post_id')
+            if type(post_id) is not int or not 0 < post_id <= MAX_ID:
+                raise ValueError(f"'{action}' needs a positive integer post_id")
+            posts[relation, post_id] = state
+        elif action in FOLLOW_TOGGLES:
+            username = operation.get('username')
+            if not isinstance(username, str):
+                raise ValueError(f"'{action}' needs a username")
+            users[username] = FOLLOW_TOGGLES[action]
+        else:
+            raise ValueError(f"Unknown action {action!r}")
+    return posts, users
+
+
+def _toggle_post_rows(user, relation, counter, wanted):
+    """Insert and delete `user`'s rows in `relation` so they match `wanted` ({post_id: state})."""
+    through = getattr(Post, relation).through
+    present = set(through.objects.filter(user_id=user.pk, post_id__in=wanted).values_list('post_id', flat=True))
+    added = [post_id for post_id, state in wanted.items() if state and post_id not in present]
+    removed = [post_id for post_id, state in wanted.items() if not state and post_id in present]
+    if added:
+        through.objects.bulk_create([through(post_id=post_id, user_id=user.pk) for post_id in added])
+        Post.objects.filter(pk__in=added).update(**{counter: F(counter) + 1}, version=F('version') + 1)
+    if removed:
+        through.objects.filter(user_id=user.pk, post_id__in=removed).delete()
+        Post.objects.filter(pk__in=removed).update(**{counter: F(counter) - 1}, version=F('version') + 1)
+
+
+def _toggle_follow_edges(user, wanted):
+    """
+    Follow and unfollow so `user`'s edges match `wanted` ({User: state}).
+    Returns the users followed, the users unfollowed and, of those, the ones
+    that dropped below the fan-out threshold.
+    """
+    present = set(follows.followee_ids(user).filter(followee__in=list(wanted)))
+    added = [target for target, state in wanted.items() if state and target.pk not in present]
+    removed = [target for target, state in wanted.items() if not state and target.pk in present]
+    if added:
+        follows.follow_many(user, added)
+        User.objects.filter(pk__in=[target.pk for target in added]).update(follower_count=F('follower_count') + 1)
+    if removed:
+        follows.unfollow_many(user, removed)
+        User.objects.filter(pk__in=[target.pk for target in removed]).update(follower_count=F('follower_count') - 1)
+    if added or removed:
+        User.objects.filter(pk=user.pk).update(following_count=F('following_count') + (len(added) - len(removed)))
+    return added, removed, timeline.demoted([target.pk for target in removed]) if removed else []
+
+
+def apply_batch(user, operations):
+    """
+    Apply a list of toggles such as {'action': 'like', 'post_id': 3} or
+    {'action': 'follow', 'username': 'bob'} in one transaction, with one bulk
+    insert and one bulk delete per relation. Only the last toggle for each
+    target counts, and posts or users that do not exist are skipped.
+    Returns the resulting state of every target that exists.
+    """
+    wanted_posts, wanted_users = _coalesce(operations)
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                post_ids = set(Post.objects.filter(pk__in={post_id for _, post_id in wanted_posts}).values_list('pk', flat=True))
+                for relation, counter in POST_COUNTERS.items():
+                    _toggle_post_rows(user, relation, counter, {
+                        post_id: state for (name, post_id), state in wanted_posts.items()
+                        if name == relation and post_id in post_ids
+                    })
+                targets = User.objects.in_bulk(list(wanted_users), field_name='username')
+                followed, unfollowed, demoted = _toggle_follow_edges(user, {
+                    target: wanted_users[username] for username, target in targets.items()
+                })
+            break
+        except IntegrityError:
+            # A concurrent request inserted one of the same rows; the retry sees it.
+            if attempt:
+                raise
+
+    for target in followed:
+        timeline.backfill(user, target)
+    for target in unfollowed:
+        timeline.prune(user, target)
+    for author in demoted:
+        timeline.refill(author)
+    if followed or unfollowed:
+        suggestions.invalidate(user)
+    return batch_state(user, post_ids, targets.values())
+
+
+def batch_state(user, post_ids, targets):
+    posts = feed_queryset(user, Post.objects.filter(pk__in=post_ids))
+    users = (
+        User.objects
+        .filter(pk__in=[target.pk for target in targets])
+        .annotate(following=Exists(Follow.objects.filter(follower=user, followee=OuterRef('pk'))))
+    )
+    return {
+        "posts": list(posts.values('id', 'liked', 'saved', 'like_count', 'save_count')),
+        "users": list(users.values('username', 'following', 'follower_count')),
+        "following_count": User.objects.filter(pk=user.pk).values_list('following_count', flat=True).get(),
+    }
+
+
+alike = sync_to_async(like)
+aunlike = sync_to_async(unlike)
+asave = sync_to_async(save)
+aunsave = sync_to_async(unsave)
+afollow = sync_to_async(follow)
+aunfollow = sync_to_async(unfollow)
+aadd_comment = sync_to_async(add_comment)
+aapply_batch = sync_to_async(apply_batch)
@@ -0,0 +1,277 @@
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.middleware.csrf import CSRF_SECRET_LENGTH
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from network import urls
+from network.models import Post, User
+
+
+# Routes that change data in ways the benchmark cannot undo.
+IRREVERSIBLE = {'logout', 'createpost', 'writecomment', 'deletepost', 'editpost'}
+
+
+def percentile(samples, p):
+    """The p-th percentile of sorted `samples`, or None if there are none."""
+    if not samples:
+        return None
+    return samples[max(math.ceil(p / 100 * len(samples)) - 1, 0)]
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every route in network/urls.py at a set concurrency, through the test client "
+        "or a running server, and report latency percentiles, throughput and queries per request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Measured requests per route.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Concurrent clients.")
+        parser.add_argument('--warmup', type=int, default=2, help="Unmeasured requests per route first.")
+        parser.add_argument('--server', help="Base URL of a running server, e.g. http://127.0.0.1:8000. "
+                                             "It must share this database and session store.")
+        parser.add_argument('--user', help="Username to browse as (default: the user following the most accounts).")
+        parser.add_argument('--routes', nargs='+', metavar='NAME', help="Only these URL names.")
+        parser.add_argument('--writes', action='store_true',
+                            help="Also benchmark like/save/follow toggles; each is undone by its opposite.")
+        parser.add_argument('--admission', action='store_true',
+                            help="Keep the write rate limits on in-process; they would turn away most --writes requests "
+                                 "from the single benchmark user.")
+        parser.add_argument('--save', metavar='FILE', help="Write the results as JSON, for use as a baseline.")
+        parser.add_argument('--baseline', metavar='FILE', help="Compare against results saved with --save.")
+
+    def handle(self, *args, **options):
+        user = self.bench_user(options['user'])
+        self.cookie = self.session_cookie(user)
+        self.server = options['server'].rstrip('/') if options['server'] else None
+        # /n/interactions checks CSRF; the cookie's secret is accepted as the token.
+        csrf = get_random_string(CSRF_SECRET_LENGTH)
+        self.headers = {
+            'Cookie': f'{settings.SESSION_COOKIE_NAME}={self.cookie}; {settings.CSRF_COOKIE_NAME}={csrf}',
+            'X-CSRFToken': csrf,
+        }
+        if self.server:
+            # Checked against the host on HTTPS.
+            self.headers['Referer'] = self.server + '/'
+        if settings.METRICS_TOKEN:
+            self.headers['Authorization'] = f'Bearer {settings.METRICS_TOKEN}'
+        self.samples = self.sample_targets(user, options['concurrency'])
+
+        overrides = {}
+        if not self.server and not options['admission']:
+            overrides['WRITE_ADMISSION'] = False
+
+        results = {}
+        with override_settings(**overrides):
+            for pattern in urls.urlpatterns:
+                name = pattern.name
+                if options['routes'] and name not in options['routes']:
+                    continue
+                requests, reason = self.requests_for(name, options['writes'])
+                if requests is None:
+                    self.stdout.write(f"{name:<16} skipped: {reason}")
+                    continue
+                results[name] = self.run(requests, options)
+                self.stdout.write(self.format_row(name, results[name], self.load_baseline(options['baseline']).get(name)))
+
+        if options['save']:
+            with open(options['save'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Saved to {options['save']}")
+
+    def bench_user(self, username):
+        users = User.objects.order_by('-following_count', 'pk')
+        user = users.filter(username=username).first() if username else users.first()
+        if user is None:
+            raise CommandError("No user to browse as; run seed_data first.")
+        return user
+
+    def session_cookie(self, user):
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def sample_targets(self, user, workers):
+        """Per worker, posts and users that `user` has not liked, saved or followed, so toggles can be undone."""
+        posts = list(
+            Post.objects.exclude(likers=user).exclude(savers=user)
+            .order_by('-date_created').values_list('pk', flat=True)[:workers * 20]
+        )
+        others = list(
+            User.objects.exclude(pk=user.pk).exclude(follower_edges__follower=user)
+            .values_list('username', flat=True)[:workers * 20]
+        )
+        image = (
+            Post.objects.exclude(content_image='').values_list('content_image', flat=True).first()
+            or User.objects.exclude(profile_pic='').exclude(profile_pic=None).values_list('profile_pic', flat=True).first()
+        )
+        popular = User.objects.order_by('-follower_count').values_list('username', flat=True).first()
+        commented = Post.objects.order_by('-comment_count').values_list('pk', flat=True).first()
+        if not posts or not others:
+            raise CommandError("Not enough posts or users to benchmark with; run seed_data first.")
+        return {
+            'posts': [posts[worker::workers] or posts for worker in range(workers)],
+            'users': [others[worker::workers] or others for worker in range(workers)],
+            'image': image, 'popular': popular, 'commented': commented,
+        }
+
+    def requests_for(self, name, writes):
+        """
+        Return (build, None), where build(worker) gives the list of (method, path, body)
+        requests for one iteration, or (None, reason) if the route is not benchmarked.
+        """
+        samples = self.samples
+
+        def get(path, query=None):
+            return lambda worker: [('GET', path + (f'?{urlencode(query)}' if query else ''), None)]
+
+        def pair(forward, backward, **kwargs):
+            def build(worker):
+                if 'id' in kwargs:
+                    target = {'id': random.choice(samples['posts'][worker])}
+                else:
+                    target = {'username': random.choice(samples['users'][worker])}
+                return [('PUT', reverse(forward, kwargs=target), None), ('PUT', reverse(backward, kwargs=target), None)]
+            return build
+
+        reads = {
+            'index': get(reverse('index')),
+            'login': get(reverse('login')),
+            'register': get(reverse('register')),
+            'profile': get(reverse('profile', args=[samples['popular']])),
+            'following': get(reverse('following')),
+            'saved': get(reverse('saved')),
+            'feed': get(reverse('feed'), {'feed': 'following'}),
+            'comments': get(reverse('comments', args=[samples['commented']])),
+            'search': get(reverse('search'), {'q': 'coffee'}),
+            'metrics': lambda worker: [('GET', reverse('metrics'), None)],
+        }
+        if samples['image']:
+            reads['media'] = get(settings.MEDIA_URL + str(samples['image']))
+        toggles = {
+            'likepost': pair('likepost', 'unlikepost', id=True),
+            'savepost': pair('savepost', 'unsavepost', id=True),
+            'followuser': pair('followuser', 'unfollowuser', username=True),
+            'interactions': lambda worker: [('POST', reverse('interactions'), json.dumps({'operations': [
+                {'action': 'like', 'post_id': post_id}, {'action': 'unlike', 'post_id': post_id},
+            ]})) for post_id in [random.choice(samples['posts'][worker])]],
+        }
+
+        if name in reads:
+            return reads[name], None
+        if name in ('unlikepost', 'unsavepost', 'unfollowuser'):
+            return None, "measured together with its opposite"
+        if name in toggles:
+            return (toggles[name], None) if writes else (None, "write route; pass --writes")
+        if name in IRREVERSIBLE:
+            return None, "changes data irreversibly"
+        if name == 'media':
+            return None, "no uploaded image to request"
+        return None, "no request defined for this route"
+
+    def run(self, build, options):
+        latencies, queries, errors = [], [], []
+        lock = threading.Lock()
+        remaining = iter(range(options['requests']))
+
+        def worker(number):
+            client = Client(headers=self.headers)
+            for _ in range(options['warmup']):
+                for request in build(number):
+                    self.send(client, *request)
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                for request in build(number):
+                    elapsed, status, count = self.send(client, *request)
+                    with lock:
+                        latencies.append(elapsed)
+                        if count is not None:
+                            queries.append(count)
+                        if status >= 400:
+                            errors.append(status)
+            connection.close()
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'throughput': round(len(latencies) / wall, 1),
+            'p50_ms': milliseconds(percentile(latencies, 50)),
+            'p95_ms': milliseconds(percentile(latencies, 95)),
+            'p99_ms': milliseconds(percentile(latencies, 99)),
+            'queries': round(sum(queries) / len(queries), 1) if queries else None,
+        }
+
+    def send(self, client, method, path, body):
+        """Return (seconds, status, queries run or None when they cannot be seen)."""
+        if self.server:
+            request = urllib.request.Request(
+                self.server + path, data=body.encode() if body else None, method=method,
+                headers={**self.headers, 'Content-Type': 'application/json'},
+            )
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as error:
+                status = error.code
+            return time.perf_counter() - started, status, None
+
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.generic(method, path, body or '', content_type='application/json', secure=not settings.DEBUG)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        return elapsed, response.status_code, len(captured)
+
+    def load_baseline(self, path):
+        if not path:
+            return {}
+        if not hasattr(self, '_baseline'):
+            with open(path) as baseline:
+                self._baseline = json.load(baseline)
+        return self._baseline
+
+    def format_row(self, name, result, baseline=None):
+        def shown(value):
+            return value if value is not None else 'n/a'
+
+        row = (
+            f"{name:<16} {result['requests']:>5} req {result['throughput']:>8} req/s  "
+            f"p50 {shown(result['p50_ms']):>8} ms  p95 {shown(result['p95_ms']):>8} ms  p99 {shown(result['p99_ms']):>8} ms  "
+            f"queries {result['queries'] if result['queries'] is not None else '-':>5}  errors {result['errors']}"
+        )
+        if baseline and None not in (result['p50_ms'], result['p95_ms'], baseline.get('p50_ms'), baseline.get('p95_ms')):
+            row += "  (p50 {:+.0%}, p95 {:+.0%})".format(
+                result['p50_ms'] / baseline['p50_ms'] - 1, result['p95_ms'] / baseline['p95_ms'] - 1,
+            )
+        return row
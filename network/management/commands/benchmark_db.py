@@ -0,0 +1,132 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+
+from network import interactions
+from network.feeds import feed_queryset
+from network.models import Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure throughput of the configured database under concurrent feed reads and "
+        "like/unlike writes. Every like is undone, so the counts return to their old values, but "
+        "each pair bumps the post's version, which changes its feed ETags and cached cards. Note "
+        "that SQLite keeps WAL mode in the file once a sqlite-tuned connection has opened it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent clients.")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds to run.")
+        parser.add_argument('--write-ratio', type=float, default=0.2, help="Share of operations that write.")
+        parser.add_argument(
+            '--profiles', nargs='+', metavar='PROFILE',
+            help="Run once per DATABASE_PROFILE (e.g. sqlite sqlite-tuned postgres) in a fresh process and compare.",
+        )
+        parser.add_argument('--json', action='store_true', help="Print the result as one JSON object.")
+
+    def handle(self, *args, **options):
+        if options['profiles']:
+            return self.compare(options)
+
+        user_ids = list(User.objects.values_list('pk', flat=True)[:500])
+        post_ids = list(Post.objects.values_list('pk', flat=True)[:5000])
+        if not user_ids or not post_ids:
+            raise CommandError("The database has no users or posts to benchmark with.")
+        close_old_connections()
+
+        results = []
+        deadline = time.monotonic() + options['duration']
+        workers = [
+            threading.Thread(target=self.client, args=(deadline, options['write_ratio'], user_ids, post_ids, results))
+            for _ in range(options['threads'])
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        result = self.summarize(results, elapsed)
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+            return
+        self.stdout.write(self.format_row(connection.settings_dict['ENGINE'].rsplit('.', 1)[-1], result))
+
+    def client(self, deadline, write_ratio, user_ids, post_ids, results):
+        latencies = {'read': [], 'write': []}
+        errors = 0
+        try:
+            while time.monotonic() < deadline:
+                kind = 'write' if random.random() < write_ratio else 'read'
+                started = time.perf_counter()
+                try:
+                    user = User(pk=random.choice(user_ids))
+                    if kind == 'read':
+                        list(feed_queryset(user).order_by('-date_created', '-id')[:10])
+                    else:
+                        post_id = random.choice(post_ids)
+                        if interactions.like(user, post_id):
+                            interactions.unlike(user, post_id)
+                        else:
+                            interactions.unlike(user, post_id)
+                            interactions.like(user, post_id)
+                    latencies[kind].append(time.perf_counter() - started)
+                except OperationalError:
+                    errors += 1
+                # What the request_finished signal does after every request.
+                close_old_connections()
+        finally:
+            connection.close()
+            results.append((latencies, errors))
+
+    def summarize(self, results, elapsed):
+        summary = {'errors': sum(errors for _, errors in results)}
+        total = 0
+        for kind in ('read', 'write'):
+            samples = sorted(latency for latencies, _ in results for latency in latencies[kind])
+            total += len(samples)
+            summary[kind] = {
+                'count': len(samples),
+                'p50_ms': round(statistics.median(samples) * 1000, 2) if samples else None,
+                'p95_ms': round(samples[int(len(samples) * 0.95) - 1] * 1000, 2) if samples else None,
+            }
+        summary['ops_per_second'] = round(total / elapsed, 1)
+        return summary
+
+    def format_row(self, name, result):
+        return (
+            f"{name:<14} {result['ops_per_second']:>9} ops/s  "
+            f"read p50 {result['read']['p50_ms']} ms p95 {result['read']['p95_ms']} ms  "
+            f"write p50 {result['write']['p50_ms']} ms p95 {result['write']['p95_ms']} ms  "
+            f"errors {result['errors']}"
+        )
+
+    def compare(self, options):
+        arguments = [
+            '--threads', str(options['threads']),
+            '--duration', str(options['duration']),
+            '--write-ratio', str(options['write_ratio']),
+            '--json',
+        ]
+        for profile in options['profiles']:
+            process = subprocess.run(
+                [sys.executable, sys.argv[0], 'benchmark_db', *arguments],
+                env={**os.environ, 'DATABASE_PROFILE': profile},
+                capture_output=True, text=True,
+            )
+            if process.returncode:
+                # Killed processes may say nothing.
+                message = (process.stderr.strip().splitlines() or [f"exit {process.returncode}"])[-1]
+                self.stderr.write(f"{profile}: {message}")
+                continue
+            self.stdout.write(self.format_row(profile, json.loads(process.stdout.strip().splitlines()[-1])))
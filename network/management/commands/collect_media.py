@@ -0,0 +1,40 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from network import blobs
+from network.models import Blob
+
+
+class Command(BaseCommand):
+    help = "Delete media files that nothing refers to any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=settings.MEDIA_GC_GRACE,
+                            help="Only delete files released or written at least this many seconds ago.")
+        parser.add_argument('--scan', action='store_true',
+                            help="Also delete stored files with no Blob row, e.g. from rolled-back uploads.")
+
+    def handle(self, *args, **options):
+        removed = blobs.collect(released_before=timezone.now() - timedelta(seconds=options['grace']))
+        if options['scan']:
+            removed += self.scan(time.time() - options['grace'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {removed} unreferenced file(s)."))
+
+    def scan(self, written_before):
+        removed = 0
+        root = os.path.join(settings.MEDIA_ROOT, blobs.BLOB_DIR)
+        for directory, _, filenames in os.walk(root):
+            relative = os.path.relpath(directory, settings.MEDIA_ROOT).replace(os.sep, '/')
+            names = {f'{relative}/{filename}' for filename in filenames if blobs.is_blob(f'{relative}/{filename}')}
+            known = set(Blob.objects.filter(name__in=names).values_list('name', flat=True))
+            for name in names - known:
+                if default_storage.get_modified_time(name).timestamp() < written_before:
+                    default_storage.remove(name)
+                    removed += 1
+        return removed
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from network import images
+from network.models import Post, User
+
+
+class Command(BaseCommand):
+    help = "Generate resized copies of uploaded post images, profile pictures and covers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate images that already have derivatives.")
+
+    def handle(self, *args, **options):
+        count = 0
+        for model, field_name in ((Post, 'content_image'), (User, 'profile_pic'), (User, 'cover')):
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for pk, name, info in rows.values_list('pk', field_name, images.variants_field(field_name)).iterator():
+                if not options['all'] and (info or {}).get('source') == name:
+                    continue
+                try:
+                    images.generate(model, pk, field_name)
+                    count += 1
+                except Exception as e:
+                    self.stderr.write(f"{model.__name__} {pk} {field_name}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Generated derivatives for {count} image(s)."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from network import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from every post, comment and user."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows fetched per query.")
+
+    def handle(self, *args, **options):
+        counts = search.rebuild(batch_size=options['batch_size'])
+        for model, count in counts.items():
+            self.stdout.write(f"{model}: {count} document(s) indexed")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
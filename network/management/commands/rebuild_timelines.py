@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from network import timeline
+from network.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized following-feed timelines from the follow graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Only rebuild these users' timelines.")
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        count = 0
+        for user in users.iterator():
+            timeline.rebuild(user)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} timeline(s)."))
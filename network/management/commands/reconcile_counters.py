@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from network import counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized like, save, comment, follower, following and post counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows per UPDATE statement.")
+
+    def handle(self, *args, **options):
+        updated = counters.reconcile(batch_size=options['batch_size'])
+        for model, count in updated.items():
+            self.stdout.write(f"{model}: {count} row(s) corrected")
+        self.stdout.write(self.style.SUCCESS("Counters reconciled."))
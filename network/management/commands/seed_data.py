@@ -0,0 +1,153 @@
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from network import counters, search, suggestions, timeline
+from network.models import Comment, Follow, Post, User
+
+
+WORDS = (
+    "morning coffee code review deploy weekend hiking photo sunset music concert game "
+    "release bug feature team launch travel city night book movie dinner friends "
+    "running coffee rain summer winter project idea design server database python"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Add synthetic users, posts, a power-law follow graph, likes, saves and comments "
+        "with bulk inserts, then rebuild counters, timelines and the search index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=30, help="Mean accounts followed per user.")
+        parser.add_argument('--likes', type=int, default=50000)
+        parser.add_argument('--saves', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--days', type=int, default=365, help="Spread post dates over this many days.")
+        parser.add_argument('--alpha', type=float, default=1.1, help="Power-law exponent for popularity.")
+        parser.add_argument('--prefix', default='seed', help="Username prefix for the new users.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, help="Random seed, for reproducible data.")
+        parser.add_argument('--skip-timelines', action='store_true', help="Do not rebuild following timelines.")
+        parser.add_argument('--skip-search', action='store_true', help="Do not rebuild the search index.")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.span = timedelta(days=options['days']).total_seconds()
+
+        user_ids = self.create_users(options['users'], options['prefix'])
+        # Popularity follows a power law: a few users get most follows,
+        # likes and posts, as on real networks.
+        self.random.shuffle(user_ids)
+        weights = list(itertools.accumulate(1 / (rank + 1) ** options['alpha'] for rank in range(len(user_ids))))
+
+        self.create_follows(user_ids, weights, options['follows'])
+        post_range = self.create_posts(user_ids, weights, options['posts'])
+        if options['posts']:
+            self.create_relation(Post.likers.through, user_ids, post_range, options['likes'])
+            self.create_relation(Post.savers.through, user_ids, post_range, options['saves'])
+            self.create_comments(user_ids, post_range, options['comments'])
+
+        self.stdout.write("Reconciling counters...")
+        counters.reconcile()
+        self.stdout.write(
+            f"Database now holds {User.objects.count()} users, {Post.objects.count()} posts, "
+            f"{Follow.objects.count()} follows, {Post.likers.through.objects.count()} likes, "
+            f"{Post.savers.through.objects.count()} saves and {Comment.objects.count()} comments."
+        )
+        if not options['skip_timelines']:
+            self.stdout.write("Rebuilding timelines...")
+            for user in User.objects.filter(pk__in=user_ids, following_count__gt=0).iterator():
+                timeline.rebuild(user)
+        if not options['skip_search']:
+            self.stdout.write("Rebuilding the search index...")
+            search.rebuild()
+        cache.delete(suggestions.POOL_KEY)
+        self.stdout.write(self.style.SUCCESS("Seeded."))
+
+    def moment(self):
+        return self.now - timedelta(seconds=self.random.random() * self.span)
+
+    def sentence(self, words):
+        return ' '.join(self.random.choices(WORDS, k=words)).capitalize()
+
+    def chunks(self, total):
+        for start in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - start)
+
+    def create_users(self, total, prefix):
+        password = make_password('password')
+        offset = User.objects.filter(username__startswith=f'{prefix}_').count()
+        user_ids = []
+        for size in self.chunks(total):
+            users = []
+            for number in range(offset + len(user_ids), offset + len(user_ids) + size):
+                users.append(User(
+                    username=f'{prefix}_{number}', password=password,
+                    first_name=self.random.choice(WORDS).capitalize(), last_name=self.random.choice(WORDS).capitalize(),
+                    bio=self.sentence(8), date_joined=self.moment(),
+                ))
+            with transaction.atomic():
+                user_ids += [user.pk for user in User.objects.bulk_create(users)]
+        return user_ids
+
+    def create_follows(self, user_ids, weights, mean):
+        batch = []
+        for follower in user_ids:
+            # Out-degree is skewed too: most users follow few, some follow many.
+            count = min(int(self.random.paretovariate(2) * mean / 2), len(user_ids) - 1)
+            followees = set(self.random.choices(user_ids, cum_weights=weights, k=count))
+            followees.discard(follower)
+            batch += [Follow(follower_id=follower, followee_id=followee, created_at=self.moment()) for followee in followees]
+            if len(batch) >= self.batch_size:
+                self.flush(Follow, batch)
+                batch = []
+        self.flush(Follow, batch)
+
+    def create_posts(self, user_ids, weights, total):
+        """Create `total` posts and return the (first, last) of their primary keys."""
+        first = last = None
+        for size in self.chunks(total):
+            authors = self.random.choices(user_ids, cum_weights=weights, k=size)
+            with transaction.atomic():
+                posts = Post.objects.bulk_create([
+                    Post(creater_id=author, content_text=self.sentence(self.random.randint(3, 20))[:140], date_created=self.moment())
+                    for author in authors
+                ])
+            first = posts[0].pk if first is None else first
+            last = posts[-1].pk
+        return first, last
+
+    def create_relation(self, through, user_ids, post_range, total):
+        for size in self.chunks(total):
+            self.flush(through, [
+                through(post_id=self.random.randint(*post_range), user_id=self.random.choice(user_ids))
+                for _ in range(size)
+            ])
+
+    def create_comments(self, user_ids, post_range, total):
+        for size in self.chunks(total):
+            self.flush(Comment, [
+                Comment(
+                    post_id=self.random.randint(*post_range), commenter_id=self.random.choice(user_ids),
+                    comment_content=self.sentence(self.random.randint(2, 12))[:90], comment_time=self.moment(),
+                )
+                for _ in range(size)
+            ])
+
+    def flush(self, model, objects):
+        # Random pairs repeat now and then; duplicate follows, likes and saves are dropped.
+        if objects:
+            with transaction.atomic():
+                model.objects.bulk_create(objects, ignore_conflicts=True)
@@ -0,0 +1,145 @@
+"""
+Serving user uploads from MEDIA_ROOT.
+
+Unlike django.views.static.serve, this view also runs with DEBUG=False and
+answers conditional requests (ETag / Last-Modified), single byte ranges and
+HEAD. Content-hashed names, such as image derivatives, are cached as
+immutable. With MEDIA_OFFLOAD set to 'nginx' or 'apache', Django only checks
+the path and hands the transfer to the front-end server through
+X-Accel-Redirect or X-Sendfile, so no Python worker is held while the file
+is sent.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+
+# "<stem>.<hex digest>.<ext>", or a blob named by its digest (network.blobs):
+# the content can never change under this name.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12,}\.\w+$|^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _cache_control(path):
+    if HASHED_NAME.search(path):
+        return 'public, max-age=31536000, immutable'
+    return f'public, max-age={settings.MEDIA_MAX_AGE}'
+
+
+def _byte_range(header, size):
+    """
+    Parse a single-range `Range` header into an inclusive (start, end) pair.
+    Returns None to serve the whole file (absent, invalid or multi-range
+    headers, which RFC 9110 says to ignore) and raises ValueError when the
+    range is valid but cannot be satisfied.
+    """
+    match = RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _if_range_matches(request, etag, last_modified):
+    validator = request.headers.get('If-Range')
+    if validator is None:
+        return True
+    if validator.startswith('"'):
+        return validator == etag
+    return parse_http_date_safe(validator) == last_modified
+
+
+def _read(path, start, length):
+    with open(path, 'rb') as source:
+        source.seek(start)
+        while length > 0:
+            chunk = source.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _offload(response, path, fullpath):
+    if settings.MEDIA_OFFLOAD == 'nginx':
+        response['X-Accel-Redirect'] = settings.MEDIA_OFFLOAD_PREFIX + quote(path)
+    else:
+        response['X-Sendfile'] = fullpath
+    return response
+
+
+@require_safe
+def serve(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404("File not found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404("File not found")
+
+    size = stat_result.st_size
+    last_modified = int(stat_result.st_mtime)
+    etag = f'"{stat_result.st_mtime_ns:x}-{size:x}"'
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': _cache_control(path),
+        'Accept-Ranges': 'bytes',
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified.setdefault(header, value)
+        return not_modified
+
+    if settings.MEDIA_OFFLOAD:
+        # The front-end server takes care of ranges from here.
+        response = HttpResponse(content_type=content_type or 'application/octet-stream', headers=headers)
+        return _offload(response, path, fullpath)
+
+    start, end = 0, size - 1
+    status = 200
+    if _if_range_matches(request, etag, last_modified):
+        try:
+            requested = _byte_range(request.headers.get('Range'), size)
+        except ValueError:
+            return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+        if requested is not None:
+            start, end = requested
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    length = end - start + 1 if size else 0
+    body = [] if request.method == 'HEAD' else _read(fullpath, start, length)
+    response = StreamingHttpResponse(body, status=status, content_type=content_type or 'application/octet-stream', headers=headers)
+    response['Content-Length'] = str(length)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,237 @@
+"""
+Request metrics in the Prometheus text format, served at /n/metrics to
+scrapes carrying METRICS_TOKEN (to anyone only when DEBUG is on and no token
+is set).
+
+MetricsMiddleware counts requests and errors and records latency, queries
+run and SQL time in histograms, all labelled with the URL name of the view,
+so the number of series stays bounded. Values are kept in a registry in the
+process.
+
+Under gunicorn every worker has its own registry. With METRICS_DIR set, each
+worker writes a snapshot of its registry to a file in that directory every
+METRICS_FLUSH_INTERVAL seconds, and /n/metrics adds up the files of all
+workers, so whichever worker answers the scrape reports for the whole
+server. Empty the directory when the server starts.
+"""
+import atexit
+import json
+import os
+import threading
+from collections import defaultdict
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .timing import measure
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# name: (type, help, buckets)
+METRICS = {
+    'http_requests_total': ('counter', "Requests answered, by view, method and status.", None),
+    'http_request_errors_total': ('counter', "Requests answered with a 5xx status, by view.", None),
+    'http_request_duration_seconds': ('histogram', "Time to produce a response, by view.", LATENCY_BUCKETS),
+    'db_queries_per_request': ('histogram', "Database queries run per request, by view.", QUERY_BUCKETS),
+    'db_query_duration_seconds': ('histogram', "Time spent in SQL per request, by view.", LATENCY_BUCKETS),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Any other method is counted as 'other', so clients cannot add series at will.
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.counters = defaultdict(float)
+        # (name, labels): [count per bucket..., count above the last bucket, sum]
+        self.histograms = {}
+
+    def inc(self, name, labels, amount=1):
+        with self.lock:
+            self.counters[name, labels] += amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        with self.lock:
+            values = self.histograms.get((name, labels))
+            if values is None:
+                values = self.histograms[name, labels] = [0] * (len(buckets) + 2)
+            values[next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))] += 1
+            values[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+
+_registry = Registry()
+_flusher = None
+
+
+def registry():
+    """The registry of this process, replaced after a fork so workers never share counts."""
+    global _registry
+    if _registry.pid != os.getpid():
+        _registry = Registry()
+    return _registry
+
+
+def _snapshot_path(pid):
+    return os.path.join(settings.METRICS_DIR, f'metrics_{pid}.json')
+
+
+def flush():
+    """Write this process's snapshot to METRICS_DIR, replacing the previous one atomically."""
+    if not settings.METRICS_DIR:
+        return
+    current = registry()
+    path = _snapshot_path(current.pid)
+    with open(path + '.tmp', 'w') as snapshot:
+        json.dump(current.snapshot(), snapshot)
+    os.replace(path + '.tmp', path)
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.pid == os.getpid():
+        return
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(settings.METRICS_FLUSH_INTERVAL):
+            flush()
+
+    _flusher = threading.Thread(target=run, name='metrics-flush', daemon=True)
+    _flusher.pid = os.getpid()
+    _flusher.start()
+    atexit.register(flush)
+
+
+def collect():
+    """Return one snapshot covering every process: this one, plus all of METRICS_DIR."""
+    if not settings.METRICS_DIR:
+        return [registry().snapshot()]
+    flush()
+    snapshots = []
+    for name in os.listdir(settings.METRICS_DIR):
+        if name.startswith('metrics_') and name.endswith('.json'):
+            try:
+                with open(os.path.join(settings.METRICS_DIR, name)) as snapshot:
+                    snapshots.append(json.load(snapshot))
+            except (OSError, ValueError):
+                # Removed or being replaced while listing.
+                continue
+    return snapshots
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    escaped = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in pairs
+    )
+    return '{%s}' % escaped if escaped else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(snapshots):
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, values in snapshot['histograms']:
+            key = name, tuple(map(tuple, labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            lines += [
+                f'{name}{_labels(labels)} {_number(value)}'
+                for (series, labels), value in sorted(counters.items()) if series == name
+            ]
+            continue
+        for (series, labels), values in sorted(histograms.items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(values[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def authorized(request):
+    if not settings.METRICS_TOKEN:
+        return settings.DEBUG
+    return constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}')
+
+
+def metrics_view(request):
+    if not authorized(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = perf_counter()
+        with measure() as timings:
+            response = self.get_response(request)
+        self.record(request, response, perf_counter() - started, timings)
+        return response
+
+    async def __acall__(self, request):
+        started = perf_counter()
+        with measure() as timings:
+            response = await self.get_response(request)
+        self.record(request, response, perf_counter() - started, timings)
+        return response
+
+    def record(self, request, response, elapsed, timings):
+        if settings.METRICS_DIR:
+            _start_flusher()
+        match = request.resolver_match
+        view = (('view', match.view_name if match else 'unmatched'),)
+        current = registry()
+        method = request.method if request.method in METHODS else 'other'
+        current.inc('http_requests_total', view + (('method', method), ('status', response.status_code)))
+        if response.status_code >= 500:
+            current.inc('http_request_errors_total', view)
+        current.observe('http_request_duration_seconds', view, elapsed)
+        current.observe('db_queries_per_request', view, len(timings.queries))
+        current.observe('db_query_duration_seconds', view, timings.sql)
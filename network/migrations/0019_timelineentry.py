@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_timelines(apps, schema_editor):
+    Follower = apps.get_model('network', 'Follower')
+    Post = apps.get_model('network', 'Post')
+    TimelineEntry = apps.get_model('network', 'TimelineEntry')
+    for follower in Follower.objects.all():
+        posts = list(Post.objects.filter(creater_id=follower.user_id).order_by('-date_created')[:200])
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=user_id, post=post, author_id=follower.user_id, date_created=post.date_created)
+            for user_id in follower.followers.values_list('id', flat=True)
+            for post in posts
+        ], batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0018_alter_comment_id_alter_follower_id_alter_post_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='network.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-date_created', '-post'], name='timeline_user_date_idx'), models.Index(fields=['user', 'author'], name='timeline_user_author_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry')],
+            },
+        ),
+        migrations.RunPython(build_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field):
+    rows = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('*')).values('count')
+    return Coalesce(Subquery(rows), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('network', 'Post')
+    User = apps.get_model('network', 'User')
+    Comment = apps.get_model('network', 'Comment')
+    Follower = apps.get_model('network', 'Follower')
+    Post.objects.update(
+        like_count=count_of(Post.likers.through, 'post'),
+        save_count=count_of(Post.savers.through, 'post'),
+        comment_count=count_of(Comment, 'post'),
+    )
+    User.objects.update(
+        follower_count=count_of(Follower.followers.through, 'follower__user'),
+        following_count=count_of(Follower.followers.through, 'user'),
+        post_count=count_of(Post, 'creater'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0019_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='save_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
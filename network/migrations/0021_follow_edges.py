@@ -0,0 +1,67 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_follower_rows(apps, schema_editor):
+    Follower = apps.get_model('network', 'Follower')
+    Follow = apps.get_model('network', 'Follow')
+    edges = Follower.followers.through.objects.values_list('user_id', 'follower__user_id')
+    batch = []
+    for follower_id, followee_id in edges.iterator(chunk_size=2000):
+        batch.append(Follow(follower_id=follower_id, followee_id=followee_id))
+        if len(batch) >= 2000:
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Follow.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def copy_follow_edges(apps, schema_editor):
+    Follower = apps.get_model('network', 'Follower')
+    Follow = apps.get_model('network', 'Follow')
+    User = apps.get_model('network', 'User')
+    for user_id in User.objects.values_list('id', flat=True).iterator():
+        follower = Follower.objects.create(user_id=user_id)
+        follower.followers.set(Follow.objects.filter(followee_id=user_id).values_list('follower_id', flat=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0020_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Follow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('followee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follower_edges', to=settings.AUTH_USER_MODEL)),
+                ('follower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='following_edges', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['followee', 'follower'], name='follow_followee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', '-created_at'], name='follow_follower_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['followee', '-created_at'], name='follow_followee_recent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('follower', 'followee'), name='unique_follow'),
+        ),
+        migrations.RunPython(copy_follower_rows, copy_follow_edges),
+        migrations.DeleteModel(
+            name='Follower',
+        ),
+    ]
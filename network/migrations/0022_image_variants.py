@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0021_follow_edges'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='content_image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='cover_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='profile_pic_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
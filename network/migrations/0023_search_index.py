@@ -0,0 +1,64 @@
+from django.db import migrations
+
+
+# Document ids are pk * 4 + kind, with kinds post=0, comment=1, user=2.
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE network_search USING fts5(
+        name, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO network_search (rowid, name, body)
+    SELECT id * 4, '', content_text FROM network_post
+    """,
+    """
+    INSERT INTO network_search (rowid, name, body)
+    SELECT id * 4 + 1, '', comment_content FROM network_comment
+    """,
+    """
+    INSERT INTO network_search (rowid, name, body)
+    SELECT id * 4 + 2, username || ' ' || first_name || ' ' || last_name, COALESCE(bio, '') FROM network_user
+    """,
+]
+
+POSTGRES_CREATE = [
+    "CREATE TABLE network_search (id bigint PRIMARY KEY, document tsvector NOT NULL)",
+    "CREATE INDEX network_search_document_idx ON network_search USING gin (document)",
+    """
+    INSERT INTO network_search (id, document)
+    SELECT id * 4, setweight(to_tsvector('simple', content_text), 'B') FROM network_post
+    """,
+    """
+    INSERT INTO network_search (id, document)
+    SELECT id * 4 + 1, setweight(to_tsvector('simple', comment_content), 'B') FROM network_comment
+    """,
+    """
+    INSERT INTO network_search (id, document)
+    SELECT id * 4 + 2,
+           setweight(to_tsvector('simple', username || ' ' || first_name || ' ' || last_name), 'A')
+           || setweight(to_tsvector('simple', COALESCE(bio, '')), 'B')
+    FROM network_user
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = POSTGRES_CREATE if schema_editor.connection.vendor == 'postgresql' else SQLITE_CREATE
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    schema_editor.execute("DROP TABLE network_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0022_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,12 +1,23 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.templatetags.static import static
 from django.utils import timezone
 
+from . import images
+
 
 class User(AbstractUser):
     profile_pic = models.ImageField(upload_to='profile_pic/', blank=True, null=True)
     bio = models.TextField(max_length=160, blank=True, null=True)
     cover = models.ImageField(upload_to='covers/', blank=True, null=True)
+    profile_pic_variants = models.JSONField(default=dict, blank=True)
+    cover_variants = models.JSONField(default=dict, blank=True)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
+
+    # What cards, comments and the sidebar show of a user.
+    DISPLAY_FIELDS = ('username', 'first_name', 'last_name', 'profile_pic', 'profile_pic_variants')
 
     def __str__(self):
         return self.username
@@ -15,7 +26,8 @@ class User(AbstractUser):
         return {
             'id': self.id,
             "username": self.username,
-            "profile_pic": self.profile_pic.url if self.profile_pic else '/static/network/default_profile.png',
+            "profile_pic": images.pick(self.profile_pic, self.profile_pic_variants, 128) or static('network/default_profile.svg'),
+            "profile_pic_original": self.profile_pic.url if self.profile_pic else None,
             "first_name": self.first_name,
             "last_name": self.last_name
         }
@@ -25,9 +37,21 @@ class Post(models.Model):
     date_created = models.DateTimeField(default=timezone.now)
     content_text = models.TextField(max_length=140, blank=True)
     content_image = models.ImageField(upload_to='posts/', blank=True)
+    content_image_variants = models.JSONField(default=dict, blank=True)
     likers = models.ManyToManyField(User,blank=True , related_name='likes')
     savers = models.ManyToManyField(User,blank=True , related_name='saved')
+    like_count = models.PositiveIntegerField(default=0)
+    save_count = models.PositiveIntegerField(default=0)
     comment_count = models.IntegerField(default=0)
+    # Bumped whenever the post's feed card changes (text, image, counters),
+    # so feed pages can be validated without being rendered.
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-date_created', '-id'], name='post_date_idx'),
+            models.Index(fields=['creater', '-date_created', '-id'], name='post_creater_date_idx'),
+        ]
 
     def __str__(self):
         return f"Post ID: {self.id} (creater: {self.creater})"
@@ -44,6 +68,11 @@ class Comment(models.Model):
     comment_content = models.TextField(max_length=90)
     comment_time = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-comment_time', '-id'], name='comment_post_time_idx'),
+        ]
+
     def __str__(self):
         return f"Post: {self.post} | Commenter: {self.commenter}"
 
@@ -55,10 +84,55 @@ class Comment(models.Model):
             "timestamp": self.comment_time.strftime("%b %d %Y, %I:%M %p")
         }
     
-class Follower(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers')
-    followers = models.ManyToManyField(User, blank=True, related_name='following')
+class Follow(models.Model):
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following_edges')
+    followee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follower_edges')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['follower', 'followee'], name='unique_follow'),
+        ]
+        indexes = [
+            models.Index(fields=['followee', 'follower'], name='follow_followee_idx'),
+            models.Index(fields=['follower', '-created_at'], name='follow_follower_recent_idx'),
+            models.Index(fields=['followee', '-created_at'], name='follow_followee_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.follower_id} follows {self.followee_id}"
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    date_created = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-date_created', '-post'], name='timeline_user_date_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"User: {self.user_id} | Post: {self.post_id}"
+
+
+class Blob(models.Model):
+    """A content-addressed media file and how many image fields and derivatives refer to it."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refs = models.IntegerField(default=0)
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refs', 'released_at'], name='blob_orphan_idx'),
+        ]
 
     def __str__(self):
-        return f"User: {self.user}"
-        
\ No newline at end of file
+        return f"{self.name} ({self.refs} refs)"
@@ -0,0 +1,200 @@
+import base64
+import binascii
+import heapq
+import json
+import math
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+AFTER = 'a'
+BEFORE = 'b'
+
+
+def encode_cursor(number, direction, position):
+    # isoformat() keeps the microseconds that DjangoJSONEncoder would drop.
+    position = [value.isoformat() if isinstance(value, datetime) else value for value in position]
+    data = json.dumps([number, direction, position], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Return (number, direction, position) for a token produced by
+    encode_cursor(), or None for a missing or malformed token.
+    """
+    if not token:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        number, direction, position = json.loads(data)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if direction not in (AFTER, BEFORE) or not isinstance(number, int):
+        return None
+    position = [parse_datetime(value) if isinstance(value, str) else value for value in position]
+    if None in position:
+        return None
+    return max(number, 1), direction, tuple(position)
+
+
+class CursorPage:
+    def __init__(self, object_list, number, previous_cursor, next_cursor, window):
+        self.object_list = object_list
+        self.number = number
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+        self.window = window
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over a queryset in descending `keys` order.
+
+    Pages are addressed by opaque cursor tokens holding the key values of the
+    row the page starts after (or ends before), so every page is an indexed
+    range scan and no page ever needs OFFSET or a total COUNT(*). The last key
+    must be unique. The navigator shows up to `window` pages either side of
+    the current one, found with cheap key-only lookahead queries.
+
+    `object_list` may also be a list of querysets sharing the same keys; each
+    one is range-scanned separately and the results are merged.
+    """
+
+    def __init__(self, object_list, per_page, keys=('date_created', 'id'), window=2):
+        if not isinstance(object_list, (list, tuple)):
+            object_list = [object_list]
+        self.sources = object_list
+        self.per_page = per_page
+        self.keys = keys
+        self.window = window
+
+    def _position(self, row):
+        return tuple(getattr(row, key) for key in self.keys)
+
+    def _range(self, queryset, direction, position):
+        prefix = '-' if direction == AFTER else ''
+        queryset = queryset.order_by(*[prefix + key for key in self.keys])
+        if position is None:
+            return queryset
+        lookup = 'lt' if direction == AFTER else 'gt'
+        condition = Q()
+        for index in reversed(range(len(self.keys))):
+            exact = {key: value for key, value in zip(self.keys[:index], position[:index])}
+            condition = Q(**exact, **{f'{self.keys[index]}__{lookup}': position[index]}) | condition
+        # Redundant with `condition`, but unlike the OR chain it lets the
+        # database seek the index to the position instead of scanning to it.
+        bound = {f'{self.keys[0]}__{lookup}e': position[0]}
+        return queryset.filter(Q(**bound) & condition)
+
+    def _fetch(self, direction, position, limit, values=None):
+        # With `values`, rows are tuples of those fields, starting with the keys.
+        results = []
+        for queryset in self.sources:
+            queryset = self._range(queryset, direction, position)
+            if values:
+                queryset = queryset.values_list(*values)
+            results.append(list(queryset[:limit]))
+        if len(results) == 1:
+            return results[0]
+
+        key = None if values else self._position
+        rows, last = [], None
+        for row in heapq.merge(*results, key=key, reverse=direction == AFTER):
+            current = row if values else self._position(row)
+            if current != last:
+                rows.append(row)
+                last = current
+        return rows[:limit]
+
+    def _links(self, number, direction, position, neighbours):
+        step = 1 if direction == AFTER else -1
+        links = []
+        for offset in range(1, self.window + 1):
+            if len(neighbours) <= (offset - 1) * self.per_page:
+                break
+            anchor = position if offset == 1 else neighbours[(offset - 1) * self.per_page - 1]
+            links.append({
+                'number': number + step * offset,
+                'cursor': encode_cursor(number + step * offset, direction, anchor),
+                'current': False,
+            })
+        return links
+
+    def page(self, token):
+        cursor = decode_cursor(token)
+        if cursor is None:
+            number, direction = 1, AFTER
+            rows = self._fetch(AFTER, None, self.per_page)
+        else:
+            number, direction, position = cursor
+            rows = self._fetch(direction, position, self.per_page)
+            if direction == BEFORE:
+                if len(rows) < self.per_page:
+                    # Reached the newest rows: show the real first page.
+                    return self.page(None)
+                rows.reverse()
+
+        newer, older = [], []
+        lookahead = self.per_page * self.window
+        if rows:
+            if cursor is not None:
+                newer = self._fetch(BEFORE, self._position(rows[0]), lookahead, values=self.keys)
+                if len(newer) < lookahead:
+                    number = math.ceil(len(newer) / self.per_page) + 1
+            older = self._fetch(AFTER, self._position(rows[-1]), lookahead, values=self.keys)
+
+        window = self._links(number, BEFORE, self._position(rows[0]), newer) if newer else []
+        window.reverse()
+        if window and window[0]['number'] == 1:
+            window[0]['cursor'] = ''
+        window.append({'number': number, 'cursor': token or '', 'current': True})
+        if older:
+            window.extend(self._links(number, AFTER, self._position(rows[-1]), older))
+
+        previous_cursor = None
+        if newer:
+            previous_cursor = '' if number == 2 else encode_cursor(number - 1, BEFORE, self._position(rows[0]))
+        next_cursor = encode_cursor(number + 1, AFTER, self._position(rows[-1])) if older else None
+        return CursorPage(rows, number, previous_cursor, next_cursor, window)
+
+    def fingerprint(self, token, *fields):
+        """
+        Return the keys and `fields` of the rows page(token) would show, plus
+        the row after them, in one narrow query per source and without the
+        navigator lookups: enough to tell whether the page has changed.
+        """
+        cursor = decode_cursor(token)
+        direction, position = (AFTER, None) if cursor is None else cursor[1:]
+        return self._fetch(direction, position, self.per_page + 1, values=self.keys + fields)
+
+    def scroll(self, token):
+        """
+        Forward-only variant of page() for incremental loading: fetches one
+        extra row to know whether there is more, and builds no navigator.
+        """
+        cursor = decode_cursor(token)
+        number, position = (1, None) if cursor is None or cursor[1] != AFTER else (cursor[0], cursor[2])
+        rows = self._fetch(AFTER, position, self.per_page + 1)
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = encode_cursor(number + 1, AFTER, self._position(rows[-1]))
+        return CursorPage(rows, number, None, next_cursor, [])
@@ -0,0 +1,214 @@
+"""
+Full-text search over posts, comments and users.
+
+Every searchable row has one document in the `network_search` table: an
+FTS5 virtual table on SQLite, or a tsvector column with a GIN index on
+PostgreSQL. A document's id packs the kind and the primary key of its row
+(pk * 4 + kind), so it is updated or removed by id without a lookup. The
+signal handlers in network.signals keep the documents in step with the
+rows, in the same transaction as the write.
+
+Each document has a `name` (usernames and full names, ranked higher) and a
+`body` (post and comment text, bios). Results are ordered by relevance and
+paged with an opaque cursor holding the last (score, id) pair.
+"""
+import re
+
+from django.db import connection, transaction
+
+from .feeds import feed_queryset, serialize_post
+from .models import Comment, Post, User
+from .pagination import AFTER, decode_cursor, encode_cursor
+
+
+POST, COMMENT, USER = 0, 1, 2
+KINDS = {'post': POST, 'comment': COMMENT, 'user': USER}
+NAME_WEIGHT = 4.0
+
+TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def document_id(kind, pk):
+    return pk * 4 + kind
+
+
+def split_document_id(doc_id):
+    return doc_id % 4, doc_id // 4
+
+
+def terms(query, limit=8):
+    return TERM.findall(query.lower())[:limit]
+
+
+class SQLiteBackend:
+    def index(self, cursor, doc_id, name, body):
+        cursor.execute("DELETE FROM network_search WHERE rowid = %s", [doc_id])
+        cursor.execute("INSERT INTO network_search (rowid, name, body) VALUES (%s, %s, %s)", [doc_id, name, body])
+
+    def remove(self, cursor, doc_ids):
+        cursor.executemany("DELETE FROM network_search WHERE rowid = %s", [[doc_id] for doc_id in doc_ids])
+
+    def clear(self, cursor):
+        cursor.execute("DELETE FROM network_search")
+
+    def optimize(self, cursor):
+        cursor.execute("INSERT INTO network_search (network_search) VALUES ('optimize')")
+
+    def match(self, words):
+        # Every word must match, the last one as a prefix so results follow typing.
+        return ' '.join([f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*'])
+
+    def search_sql(self, by_kind, after):
+        # bm25() is lower for better matches, which gives an ascending order.
+        return f"""
+            SELECT id, score FROM (
+                SELECT rowid AS id, bm25(network_search, {NAME_WEIGHT}, 1.0) AS score
+                FROM network_search
+                WHERE network_search MATCH %s {'AND rowid %% 4 = %s' if by_kind else ''}
+            ) {'WHERE score > %s OR (score = %s AND id > %s)' if after else ''}
+            ORDER BY score, id LIMIT %s
+        """
+
+
+class PostgresBackend:
+    def index(self, cursor, doc_id, name, body):
+        cursor.execute(
+            """
+            INSERT INTO network_search (id, document)
+            VALUES (%s, setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B'))
+            ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document
+            """,
+            [doc_id, name, body],
+        )
+
+    def remove(self, cursor, doc_ids):
+        cursor.execute("DELETE FROM network_search WHERE id = ANY(%s)", [list(doc_ids)])
+
+    def clear(self, cursor):
+        cursor.execute("TRUNCATE network_search")
+
+    def optimize(self, cursor):
+        cursor.execute("VACUUM ANALYZE network_search")
+
+    def match(self, words):
+        return ' & '.join([f"'{word}'" for word in words[:-1]] + [f"'{words[-1]}':*"])
+
+    def search_sql(self, by_kind, after):
+        # Negated so that, as with bm25(), better matches sort first.
+        return f"""
+            SELECT id, score FROM (
+                SELECT id, -ts_rank_cd(document, query) AS score
+                FROM network_search, to_tsquery('simple', %s) AS query
+                WHERE document @@ query {'AND id %% 4 = %s' if by_kind else ''}
+            ) AS matches
+            {'WHERE score > %s OR (score = %s AND id > %s)' if after else ''}
+            ORDER BY score, id LIMIT %s
+        """
+
+
+def backend():
+    return PostgresBackend() if connection.vendor == 'postgresql' else SQLiteBackend()
+
+
+def post_document(post):
+    return '', post.content_text
+
+
+def comment_document(comment):
+    return '', comment.comment_content
+
+
+def user_document(user):
+    return f'{user.username} {user.first_name} {user.last_name}', user.bio or ''
+
+
+DOCUMENTS = {POST: post_document, COMMENT: comment_document, USER: user_document}
+
+
+def index(kind, instance):
+    name, body = DOCUMENTS[kind](instance)
+    with connection.cursor() as cursor:
+        backend().index(cursor, document_id(kind, instance.pk), name, body)
+
+
+def remove(kind, *pks):
+    if pks:
+        with connection.cursor() as cursor:
+            backend().remove(cursor, [document_id(kind, pk) for pk in pks])
+
+
+def rebuild(batch_size=2000):
+    """Drop every document and index all posts, comments and users again."""
+    search_backend = backend()
+    counts = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        search_backend.clear(cursor)
+        for kind, queryset in ((POST, Post.objects.all()), (COMMENT, Comment.objects.all()), (USER, User.objects.all())):
+            counts[queryset.model.__name__] = 0
+            for instance in queryset.iterator(chunk_size=batch_size):
+                name, body = DOCUMENTS[kind](instance)
+                search_backend.index(cursor, document_id(kind, instance.pk), name, body)
+                counts[queryset.model.__name__] += 1
+    with connection.cursor() as cursor:
+        search_backend.optimize(cursor)
+    return counts
+
+
+def search(query, kind=None, cursor=None, limit=20):
+    """
+    Return ([(kind, pk), ...], next_cursor) for the best matches of `query`,
+    optionally restricted to one kind ('post', 'comment' or 'user').
+    """
+    words = terms(query)
+    if not words:
+        return [], None
+    search_backend = backend()
+    params = [search_backend.match(words)]
+    if kind is not None:
+        params.append(KINDS[kind])
+    after = decode_cursor(cursor)
+    if after is not None and len(after[2]) == 2:
+        score, doc_id = after[2]
+        params += [score, score, doc_id]
+    else:
+        after = None
+    params.append(limit + 1)
+
+    with connection.cursor() as db:
+        db.execute(search_backend.search_sql(kind is not None, after is not None), params)
+        rows = db.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        doc_id, score = rows[-1]
+        next_cursor = encode_cursor(1, AFTER, (score, doc_id))
+    return [split_document_id(doc_id) for doc_id, _ in rows], next_cursor
+
+
+def load(hits, viewer):
+    """Fetch and serialize the rows behind `hits`, one query per kind, keeping the ranking."""
+    wanted = {kind: [pk for hit_kind, pk in hits if hit_kind == kind] for kind in DOCUMENTS}
+    rows = {
+        POST: feed_queryset(viewer, Post.objects.filter(pk__in=wanted[POST])),
+        COMMENT: Comment.objects.filter(pk__in=wanted[COMMENT]).select_related('commenter'),
+        USER: User.objects.filter(pk__in=wanted[USER]),
+    }
+    found = {
+        (kind, row.pk): row
+        for kind, queryset in rows.items() if wanted[kind]
+        for row in queryset
+    }
+    results = []
+    for hit in hits:
+        row = found.get(hit)
+        if row is None:
+            continue
+        kind = hit[0]
+        if kind == POST:
+            results.append({"type": "post", **serialize_post(row, viewer)})
+        elif kind == COMMENT:
+            results.append({"type": "comment", "post_id": row.post_id, **row.serialize()})
+        else:
+            results.append({"type": "user", "bio": row.bio or '', "follower_count": row.follower_count, **row.serialize()})
+    return results
@@ -0,0 +1,70 @@
+"""
+Keep the search index in step with posts, comments and users, drop cached
+users when their row changes, and release the media files of deleted posts
+and users. The handlers run inside the transaction that saves or deletes
+the row.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import backends, blobs, search
+from .models import Comment, Post, User
+
+
+# Fields whose changes do not affect a user's search document.
+UNSEARCHED_USER_FIELDS = {
+    'last_login', 'password', 'profile_pic', 'cover', 'profile_pic_variants', 'cover_variants',
+    'follower_count', 'following_count', 'post_count',
+}
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'content_text' in update_fields:
+        search.index(search.POST, instance)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, **kwargs):
+    search.index(search.COMMENT, instance)
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or not set(update_fields) <= UNSEARCHED_USER_FIELDS:
+        search.index(search.USER, instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post(sender, instance, **kwargs):
+    search.remove(search.POST, instance.pk)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment(sender, instance, **kwargs):
+    search.remove(search.COMMENT, instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def remove_user(sender, instance, **kwargs):
+    search.remove(search.USER, instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, **kwargs):
+    # After commit, so a concurrent request cannot cache the old row again.
+    transaction.on_commit(partial(backends.forget, instance.pk))
+
+
+@receiver(post_delete, sender=Post)
+def release_post_media(sender, instance, **kwargs):
+    blobs.release(blobs.references(instance, 'content_image'))
+
+
+@receiver(post_delete, sender=User)
+def release_user_media(sender, instance, **kwargs):
+    blobs.release(blobs.references(instance, 'profile_pic') + blobs.references(instance, 'cover'))
@@ -253,76 +253,148 @@ function del_image() {
     }
 }
 
-function like_post(element) {
-    if(document.querySelector('#user_is_authenticated').value === 'False') {
-        login_popup('like');
-        return false;
+// Like, save and follow toggles are queued and sent to /n/interactions in one
+// request once clicks stop for INTERACTION_DELAY ms. The page is updated
+// straight away and corrected from the server's answer.
+const INTERACTION_DELAY = 400;
+let pending_interactions = new Map();
+let interaction_timer = null;
+
+window.addEventListener('pagehide', () => flush_interactions(true));
+
+function queue_interaction(key, operation) {
+    // Only the last toggle of each target is sent.
+    pending_interactions.delete(key);
+    pending_interactions.set(key, operation);
+    clearTimeout(interaction_timer);
+    interaction_timer = setTimeout(flush_interactions, INTERACTION_DELAY);
+}
+
+function flush_interactions(keepalive=false) {
+    clearTimeout(interaction_timer);
+    if(pending_interactions.size === 0) {
+        return;
     }
-    let id = element.dataset.post_id;
-    fetch('/n/post/'+parseInt(id)+'/like', {
-        method: 'PUT'
+    let entries = Array.from(pending_interactions.entries());
+    pending_interactions.clear();
+    fetch('/n/interactions', {
+        method: 'POST',
+        // The token of the new post form in the layout.
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': document.querySelector('input[name="csrfmiddlewaretoken"]').value
+        },
+        body: JSON.stringify({operations: entries.map(([key, operation]) => operation)}),
+        keepalive: keepalive
     })
-    .then(() => {
-        let count = element.querySelector('.likes_count');
-        let value = count.innerHTML;
-        value++;
-        count.innerHTML = value;
+    .then(response => {
+        if(response.status === 429 || response.status === 503) {
+            // Turned away under load: queue the toggles again, unless clicked
+            // since, and retry when the server says to.
+            entries.forEach(([key, operation]) => {
+                if(!pending_interactions.has(key)) {
+                    pending_interactions.set(key, operation);
+                }
+            });
+            clearTimeout(interaction_timer);
+            interaction_timer = setTimeout(flush_interactions, (parseInt(response.headers.get('Retry-After')) || 1) * 1000);
+            return;
+        }
+        return response.json().then(show_interaction_state);
+    })
+    .catch(() => {});
+}
+
+function show_interaction_state(state) {
+    // Targets clicked again while the request was in flight keep their newer local state.
+    state.posts.forEach(post => {
+        if(!pending_interactions.has('like:'+post.id)) {
+            document.querySelectorAll(`.like[data-post_id="${post.id}"]`).forEach(element => show_like(element, post.liked, post.like_count));
+        }
+        if(!pending_interactions.has('save:'+post.id)) {
+            document.querySelectorAll(`.save[data-post_id="${post.id}"]`).forEach(element => show_save(element, post.saved));
+        }
+    });
+    if(document.querySelector('.body').dataset.page !== 'profile') {
+        return;
+    }
+    let profile = document.querySelector('.profile-view').dataset.user;
+    state.users.forEach(user => {
+        if(user.username === profile && !pending_interactions.has('follow:'+user.username)) {
+            document.querySelector('#follower__count').innerHTML = user.follower_count;
+        }
+    });
+    let follows_pending = Array.from(pending_interactions.keys()).some(key => key.startsWith('follow:'));
+    if(profile === document.querySelector('#user_is_authenticated').dataset.username && !follows_pending) {
+        document.querySelector('#following__count').innerHTML = state.following_count;
+    }
+}
+
+function show_like(element, liked, count) {
+    element.querySelector('.likes_count').innerHTML = count;
+    if(liked) {
         element.querySelector('.svg-span').innerHTML = `
             <svg width="1.1em" height="1.1em" viewBox="0 -1 16 16" class="bi bi-heart-fill" fill="#e0245e" xmlns="http://www.w3.org/2000/svg">
                 <path fill-rule="evenodd" d="M8 1.314C12.438-3.248 23.534 4.735 8 15-7.534 4.736 3.562-3.248 8 1.314z"/>
             </svg>`;
         element.setAttribute('onclick','unlike_post(this)');
-    })
-}
-
-function unlike_post(element) {
-    let id = element.dataset.post_id;
-    fetch('/n/post/'+parseInt(id)+'/unlike', {
-        method: 'PUT'
-    })
-    .then(() => {
-        let count = element.querySelector('.likes_count');
-        let value = count.innerHTML;
-        value--;
-        count.innerHTML = value;
+    }
+    else {
         element.querySelector('.svg-span').innerHTML = `
             <svg width="1.1em" height="1.1em" viewBox="0 -1 16 16" class="bi bi-heart" fill="currentColor" xmlns="http://www.w3.org/2000/svg">
                 <path fill-rule="evenodd" d="M8 2.748l-.717-.737C5.6.281 2.514.878 1.4 3.053c-.523 1.023-.641 2.5.314 4.385.92 1.815 2.834 3.989 6.286 6.357 3.452-2.368 5.365-4.542 6.286-6.357.955-1.886.838-3.362.314-4.385C13.486.878 10.4.28 8.717 2.01L8 2.748zM8 15C-7.333 4.868 3.279-3.04 7.824 1.143c.06.055.119.112.176.171a3.12 3.12 0 0 1 .176-.17C12.72-3.042 23.333 4.867 8 15z"/>
             </svg>`;
         element.setAttribute('onclick','like_post(this)');
-    })
+    }
 }
 
-function save_post(element) {
-    if(document.querySelector('#user_is_authenticated').value === 'False') {
-        login_popup('save');
-        return false;
-    }
-    let id = element.dataset.post_id;
-    fetch('/n/post/'+parseInt(id)+'/save', {
-        method: 'PUT'
-    })
-    .then(() => {
+function show_save(element, saved) {
+    if(saved) {
         element.querySelector('.svg-span').innerHTML = `
             <svg width="1.1em" height="1.1em" viewBox="0.5 0 15 15" class="bi bi-bookmark-fill" fill="#17bf63" xmlns="http://www.w3.org/2000/svg">
                 <path fill-rule="evenodd" d="M3 3a2 2 0 0 1 2-2h6a2 2 0 0 1 2 2v12l-5-3-5 3V3z"/>
             </svg>`;
         element.setAttribute('onclick','unsave_post(this)');
-    });
+    }
+    else {
+        element.querySelector('.svg-span').innerHTML = `
+            <svg width="1.1em" height="1.1em" viewBox="0.5 0 15 15" class="bi bi-bookmark" fill="currentColor" xmlns="http://www.w3.org/2000/svg">
+                <path fill-rule="evenodd" d="M8 12l5 3V3a2 2 0 0 0-2-2H5a2 2 0 0 0-2 2v12l5-3zm-4 1.234l4-2.4 4 2.4V3a1 1 0 0 0-1-1H5a1 1 0 0 0-1 1v10.234z"/>
+            </svg>`;
+        element.setAttribute('onclick','save_post(this)');
+    }
+}
+
+function like_post(element) {
+    if(document.querySelector('#user_is_authenticated').value === 'False') {
+        login_popup('like');
+        return false;
+    }
+    let id = parseInt(element.dataset.post_id);
+    show_like(element, true, parseInt(element.querySelector('.likes_count').innerHTML) + 1);
+    queue_interaction('like:'+id, {action: 'like', post_id: id});
+}
+
+function unlike_post(element) {
+    let id = parseInt(element.dataset.post_id);
+    show_like(element, false, parseInt(element.querySelector('.likes_count').innerHTML) - 1);
+    queue_interaction('like:'+id, {action: 'unlike', post_id: id});
+}
+
+function save_post(element) {
+    if(document.querySelector('#user_is_authenticated').value === 'False') {
+        login_popup('save');
+        return false;
+    }
+    let id = parseInt(element.dataset.post_id);
+    show_save(element, true);
+    queue_interaction('save:'+id, {action: 'save', post_id: id});
 }
 
 function unsave_post(element) {
-    let id = element.dataset.post_id;
-    fetch('/n/post/'+parseInt(id)+'/unsave', {
-        method: 'PUT'
-    })
-    .then(() => {
-        element.querySelector('.svg-span').innerHTML = `
-        <svg width="1.1em" height="1.1em" viewBox="0.5 0 15 15" class="bi bi-bookmark" fill="currentColor" xmlns="http://www.w3.org/2000/svg">
-            <path fill-rule="evenodd" d="M8 12l5 3V3a2 2 0 0 0-2-2H5a2 2 0 0 0-2 2v12l5-3zm-4 1.234l4-2.4 4 2.4V3a1 1 0 0 0-1-1H5a1 1 0 0 0-1 1v10.234z"/>
-        </svg>`;
-        element.setAttribute('onclick','save_post(this)');
-    });
+    let id = parseInt(element.dataset.post_id);
+    show_save(element, false);
+    queue_interaction('save:'+id, {action: 'unsave', post_id: id});
 }
 
 
@@ -331,31 +403,27 @@ function follow_user(element, username, origin) {
         login_popup('follow');
         return false;
     }
-    fetch('/'+username+'/follow', {
-        method: 'PUT'
-    })
-    .then(() => {
-        if(origin === 'suggestion') {
-            element.parentElement.innerHTML = `<button class="btn btn-success" type="button" onclick="unfollow_user(this,'${username}','suggestion')">Following</button>`;
-        }
-        else if(origin === 'edit_page') {
-            element.parentElement.innerHTML = `<button class="btn btn-success float-right" onclick="unfollow_user(this,'${username}','edit_page')" id="following-btn">Following</button>`;
-        }
-        else if(origin === 'dropdown') {
-            ////////////////////////////////////////////////////////////////////////////////////////////
-        }
+    queue_interaction('follow:'+username, {action: 'follow', username: username});
+    if(origin === 'suggestion') {
+        element.parentElement.innerHTML = `<button class="btn btn-success" type="button" onclick="unfollow_user(this,'${username}','suggestion')">Following</button>`;
+    }
+    else if(origin === 'edit_page') {
+        element.parentElement.innerHTML = `<button class="btn btn-success float-right" onclick="unfollow_user(this,'${username}','edit_page')" id="following-btn">Following</button>`;
+    }
+    else if(origin === 'dropdown') {
+        ////////////////////////////////////////////////////////////////////////////////////////////
+    }
 
-        if(document.querySelector('.body').dataset.page === 'profile') {
-            if(document.querySelector('.profile-view').dataset.user === username) {
-                document.querySelector('#follower__count').innerHTML++;
-            }
+    if(document.querySelector('.body').dataset.page === 'profile') {
+        if(document.querySelector('.profile-view').dataset.user === username) {
+            document.querySelector('#follower__count').innerHTML++;
         }
-        if(document.querySelector('.body').dataset.page === 'profile') {
-            if(document.querySelector('.profile-view').dataset.user === document.querySelector('#user_is_authenticated').dataset.username) {
-                document.querySelector('#following__count').innerHTML++;
-            }
+    }
+    if(document.querySelector('.body').dataset.page === 'profile') {
+        if(document.querySelector('.profile-view').dataset.user === document.querySelector('#user_is_authenticated').dataset.username) {
+            document.querySelector('#following__count').innerHTML++;
         }
-    });
+    }
 }
 
 function unfollow_user(element, username, origin) {
@@ -363,31 +431,27 @@ function unfollow_user(element, username, origin) {
         login_popup('follow');
         return false;
     }
-    fetch('/'+username+'/unfollow', {
-        method: 'PUT'
-    })
-    .then(() => {
-        if(origin === 'suggestion') {
-            element.parentElement.innerHTML = `<button class="btn btn-outline-success" type="button" onclick="follow_user(this,'${username}','suggestion')">Follow</button>`;
-        }
-        else if(origin === 'edit_page') {
-            element.parentElement.innerHTML = `<button class="btn btn-outline-success float-right" onclick="follow_user(this,'${username}','edit_page')" id="follow-btn">Follow</button>`;
-        }
-        else if(origin === 'dropdown') {
-            ///////////////////////////////////////////////////////////////////////////////////////////
-        }
+    queue_interaction('follow:'+username, {action: 'unfollow', username: username});
+    if(origin === 'suggestion') {
+        element.parentElement.innerHTML = `<button class="btn btn-outline-success" type="button" onclick="follow_user(this,'${username}','suggestion')">Follow</button>`;
+    }
+    else if(origin === 'edit_page') {
+        element.parentElement.innerHTML = `<button class="btn btn-outline-success float-right" onclick="follow_user(this,'${username}','edit_page')" id="follow-btn">Follow</button>`;
+    }
+    else if(origin === 'dropdown') {
+        ///////////////////////////////////////////////////////////////////////////////////////////
+    }
 
-        if(document.querySelector('.body').dataset.page === 'profile') {
-            if(document.querySelector('.profile-view').dataset.user === username) {
-                document.querySelector('#follower__count').innerHTML--;
-            }
+    if(document.querySelector('.body').dataset.page === 'profile') {
+        if(document.querySelector('.profile-view').dataset.user === username) {
+            document.querySelector('#follower__count').innerHTML--;
         }
-        if(document.querySelector('.body').dataset.page === 'profile') {
-            if(document.querySelector('.profile-view').dataset.user === document.querySelector('#user_is_authenticated').dataset.username) {
-                document.querySelector('#following__count').innerHTML--;
-            }
+    }
+    if(document.querySelector('.body').dataset.page === 'profile') {
+        if(document.querySelector('.profile-view').dataset.user === document.querySelector('#user_is_authenticated').dataset.username) {
+            document.querySelector('#following__count').innerHTML--;
         }
-    });
+    }
 }
 
 
@@ -407,13 +471,7 @@ function show_comment(element) {
     }
     comment_div.querySelector('#spinner').style.display = 'block';
     comment_div.style.display = 'block';
-    fetch('/n/post/'+parseInt(post_id)+'/comments')
-    .then(response => response.json())
-    .then(comments => {
-        comments.forEach(comment => {
-            display_comment(comment,comment_comments);
-        });
-    })
+    load_comments(post_id, comment_comments)
     .then(() => {
         setTimeout(() => {
             comment_div.querySelector('.spinner-div').style.display = 'none';
@@ -423,6 +481,34 @@ function show_comment(element) {
     });
 }
 
+function load_comments(post_id, container, cursor='') {
+    let url = '/n/post/'+parseInt(post_id)+'/comments';
+    if(cursor) {
+        url += '?cursor='+encodeURIComponent(cursor);
+    }
+    return fetch(url)
+    .then(response => response.json())
+    .then(page => {
+        page.comments.forEach(comment => {
+            display_comment(comment,container);
+        });
+        let more = container.parentElement.querySelector('.load-more-comments');
+        if(more) {
+            more.remove();
+        }
+        if(page.next_cursor) {
+            more = document.createElement('div');
+            more.className = 'load-more-comments';
+            more.innerText = 'Show more comments';
+            more.addEventListener('click', () => {
+                more.innerText = 'Loading...';
+                load_comments(post_id, container, page.next_cursor);
+            });
+            container.after(more);
+        }
+    });
+}
+
 function write_comment(element) {
     let post_id = element.parentElement.parentElement.parentElement.parentElement.parentElement.dataset.post_id;
     let comment_text = element.querySelector('.comment-input').value;
@@ -491,3 +577,288 @@ function goto_register() {
 function goto_login() {
     window.location.href = '/n/login';
 }
+
+// Search box: /n/search is queried once typing pauses for SEARCH_DELAY ms.
+const SEARCH_DELAY = 250;
+let search_timer = null;
+
+document.addEventListener('DOMContentLoaded', () => {
+    let box = document.querySelector('#search-box');
+    box.addEventListener('input', () => {
+        clearTimeout(search_timer);
+        search_timer = setTimeout(() => search(box.value), SEARCH_DELAY);
+    });
+    box.closest('form').addEventListener('submit', event => {
+        event.preventDefault();
+        clearTimeout(search_timer);
+        search(box.value);
+    });
+});
+
+function escape_html(text) {
+    let div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function search(query, cursor='') {
+    let container = document.querySelector('#search-results');
+    if(query.trim().length === 0) {
+        container.style.display = 'none';
+        container.innerHTML = '';
+        return;
+    }
+    let url = '/n/search?q='+encodeURIComponent(query);
+    if(cursor) {
+        url += '&cursor='+encodeURIComponent(cursor);
+    }
+    fetch(url)
+    .then(response => response.json())
+    .then(data => {
+        // Ignore answers to a query the user has already typed past.
+        if(document.querySelector('#search-box').value !== query) {
+            return;
+        }
+        if(!cursor) {
+            container.innerHTML = `<div class="suggestion-header">Search results</div>`;
+            if(data.results.length === 0) {
+                container.innerHTML += `
+                    <div style="text-align: center; border-bottom: .5px solid #e6ecf0; padding: 10px 15px;">
+                        <span class="grey" style="font-size: .9em;">No results.</span>
+                    </div>`;
+            }
+        }
+        let more = container.querySelector('.suggestion-footer');
+        if(more) {
+            more.remove();
+        }
+        data.results.forEach(result => container.append(search_result(result)));
+        if(data.next_cursor) {
+            let footer = document.createElement('div');
+            footer.className = 'suggestion-footer';
+            footer.innerHTML = `<a href="#">Show more</a>`;
+            footer.querySelector('a').addEventListener('click', event => {
+                event.preventDefault();
+                search(query, data.next_cursor);
+            });
+            container.append(footer);
+        }
+        container.style.display = 'block';
+    });
+}
+
+function search_result(result) {
+    let user = result.type === 'user' ? result : (result.type === 'post' ? result.creater : result.commenter);
+    let text = result.type === 'user' ? result.bio : (result.type === 'post' ? result.text : result.body);
+    let row = document.createElement('div');
+    row.className = 'suggestion-user search-result';
+    row.innerHTML = `
+        <div>
+            <a href="/${encodeURIComponent(user.username)}">
+                <div class="small-profilepic" style="background-image: url(${user.profile_pic})"></div>
+            </a>
+        </div>
+        <div class="user-details">
+            <a href="/${encodeURIComponent(user.username)}">
+                <div id="user-name">
+                    <strong>${escape_html(user.first_name)} ${escape_html(user.last_name)}</strong>
+                </div>
+                <div class="grey">@${escape_html(user.username)}</div>
+                <div class="search-text">${escape_html(text)}</div>
+            </a>
+        </div>`;
+    return row;
+}
+
+// Infinite scroll: when the end of a feed comes into view, the next page is
+// fetched from /n/feed and its cards appended; the page after it is then
+// fetched ahead of time while the browser is idle. The pagination bar stays
+// in place for browsers without IntersectionObserver.
+document.addEventListener('DOMContentLoaded', () => {
+    let feed = document.querySelector('.main-div-content[data-feed_url]');
+    if(!feed || !('IntersectionObserver' in window)) {
+        return;
+    }
+    feed.querySelector('.pagination-bar').style.display = 'none';
+    let sentinel = document.createElement('div');
+    sentinel.className = 'feed-sentinel';
+    feed.append(sentinel);
+    let state = {url: feed.dataset.feed_url, cursor: feed.dataset.next_cursor, request: null, loading: false};
+    let observer = new IntersectionObserver(entries => {
+        if(entries[0].isIntersecting) {
+            show_next_feed_page(state, sentinel, observer);
+        }
+    }, {rootMargin: '0px 0px 600px 0px'});
+    observer.observe(sentinel);
+    prefetch_feed_page(state);
+});
+
+function fetch_feed_page(state) {
+    if(!state.request) {
+        state.request = fetch(state.url+'&cursor='+encodeURIComponent(state.cursor))
+        .then(response => {
+            if(!response.ok) {
+                throw new Error('Feed request failed: '+response.status);
+            }
+            return response.json();
+        });
+    }
+    return state.request;
+}
+
+function prefetch_feed_page(state) {
+    let when_idle = window.requestIdleCallback || (callback => setTimeout(callback, 200));
+    when_idle(() => {
+        if(state.cursor) {
+            fetch_feed_page(state).catch(() => {});
+        }
+    });
+}
+
+function show_next_feed_page(state, sentinel, observer) {
+    if(state.loading || !state.cursor) {
+        return;
+    }
+    state.loading = true;
+    fetch_feed_page(state)
+    .then(page => {
+        let cards = document.createDocumentFragment();
+        page.posts.forEach(post => cards.append(render_post(post)));
+        sentinel.before(cards);
+        state.cursor = page.next_cursor;
+        state.request = null;
+        if(state.cursor) {
+            prefetch_feed_page(state);
+            // Observing again reports the sentinel at once if it is still in view.
+            observer.unobserve(sentinel);
+            observer.observe(sentinel);
+        }
+        else {
+            observer.disconnect();
+        }
+    })
+    .catch(error => {
+        state.request = null;
+        console.log(error);
+    })
+    .finally(() => {
+        state.loading = false;
+    });
+}
+
+function render_post(post) {
+    let viewer = document.querySelector('#user_is_authenticated');
+    let profile = '/'+encodeURIComponent(post.creater.username);
+    let card = document.createElement('div');
+    card.className = 'post';
+    card.dataset.post_id = post.id;
+    let menu = '';
+    if(post.own) {
+        menu = `
+            <button class="dropdown-item" style="color: #e0245e;" onclick="confirm_delete(${parseInt(post.id)})">
+                <svg width="1.1em" height="1.1em" viewBox="0 0 16 16" class="bi bi-trash" fill="#e0245e" xmlns="http://www.w3.org/2000/svg">
+                    <path d="M5.5 5.5A.5.5 0 0 1 6 6v6a.5.5 0 0 1-1 0V6a.5.5 0 0 1 .5-.5zm2.5 0a.5.5 0 0 1 .5.5v6a.5.5 0 0 1-1 0V6a.5.5 0 0 1 .5-.5zm3 .5a.5.5 0 0 0-1 0v6a.5.5 0 0 0 1 0V6z"/>
+                    <path fill-rule="evenodd" d="M14.5 3a1 1 0 0 1-1 1H13v9a2 2 0 0 1-2 2H5a2 2 0 0 1-2-2V4h-.5a1 1 0 0 1-1-1V2a1 1 0 0 1 1-1H6a1 1 0 0 1 1-1h2a1 1 0 0 1 1 1h3.5a1 1 0 0 1 1 1v1zM4.118 4L4 4.059V13a1 1 0 0 0 1 1h6a1 1 0 0 0 1-1V4.059L11.882 4H4.118zM2.5 3V2h11v1h-11z"/>
+                </svg>
+                &nbsp;Delete
+            </button>
+            <button class="dropdown-item" onclick="edit_post(this)">
+                <svg width="1.1em" height="1.1em" viewBox="0 0 16 16" class="bi bi-pencil" fill="currentColor" xmlns="http://www.w3.org/2000/svg">
+                    <path fill-rule="evenodd" d="M11.293 1.293a1 1 0 0 1 1.414 0l2 2a1 1 0 0 1 0 1.414l-9 9a1 1 0 0 1-.39.242l-3 1a1 1 0 0 1-1.266-1.265l1-3a1 1 0 0 1 .242-.391l9-9zM12 2l2 2-9 9-3 1 1-3 9-9z"/>
+                    <path fill-rule="evenodd" d="M12.146 6.354l-2.5-2.5.708-.708 2.5 2.5-.707.708zM3 10v.5a.5.5 0 0 0 .5.5H4v.5a.5.5 0 0 0 .5.5H5v.5a.5.5 0 0 0 .5.5H6v-1.5a.5.5 0 0 0-.5-.5H5v-.5a.5.5 0 0 0-.5-.5H3z"/>
+                </svg>
+                &nbsp;Edit post
+            </button>`;
+    }
+    let comment_form = '';
+    if(viewer.value === 'True') {
+        comment_form = `
+            <div class="comment-div-data" style="display: none;">
+                <div class="head-comment-input">
+                    <div>
+                        <a href="/${encodeURIComponent(viewer.dataset.username)}">
+                            <div class="small-profilepic"></div>
+                        </a>
+                    </div>
+                    <div style="flex: 1;">
+                        <div class="comment-input-div">
+                            <form class="comment-form" onsubmit="return write_comment(this)">
+                                <input type="text" name="comment" class="comment-input" placeholder="Write a comment...">
+                            </form>
+                        </div>
+                    </div>
+                </div>
+                <div class="comment-comments"></div>
+            </div>`;
+    }
+    card.innerHTML = `
+        <div>
+            <div>
+                <a href="${profile}">
+                    <div class="small-profilepic"></div>
+                </a>
+            </div>
+            <div style="flex: 1">
+                <div class="post-user">
+                    <div>
+                        <a href="${profile}">
+                            <span><strong>${escape_html(post.creater.first_name)} ${escape_html(post.creater.last_name)}</strong></span>
+                        </a>
+                        <a href="${profile}">
+                            <span class="grey">&nbsp;@${escape_html(post.creater.username)}</span>
+                        </a>
+                        <span class="grey">&nbsp;&middot;&nbsp;&nbsp;${escape_html(post.timestamp)}</span>
+                    </div>
+                    <div class="dropdown" style="height: 1em; margin-top: -3px; margin-right: -3px;">
+                        <button class="icon-btn dropdown-toggle" type="button" onfocus="drop_down(event)" onblur="remove_drop_down(event)" data-toggle="dropdown" aria-haspopup="true" aria-expanded="false">
+                            <svg width="1em" height="1em" viewBox="0 -2 16 16" class="bi bi-chevron-down" fill="currentColor" xmlns="http://www.w3.org/2000/svg">
+                                <path fill-rule="evenodd" d="M1.646 4.646a.5.5 0 0 1 .708 0L8 10.293l5.646-5.647a.5.5 0 0 1 .708.708l-6 6a.5.5 0 0 1-.708 0l-6-6a.5.5 0 0 1 0-.708z"/>
+                            </svg>
+                        </button>
+                        <div class="dropdown-menu">${menu}</div>
+                    </div>
+                </div>
+                <div class="post-content"></div>
+                <div class="post-image" style="display: none;"></div>
+                <div class="post-actions">
+                    <div class="like" data-post_id="${parseInt(post.id)}">
+                        <div class="svg-span"></div>
+                        &nbsp;
+                        <div style="padding: 7px 0px;" class="likes_count"></div>
+                    </div>
+                    <div class="comment" onclick="show_comment(this)">
+                        <div class="svg-span">
+                            <svg width="1.1em" height="1.1em" viewBox="0 0 16 16" class="bi bi-chat" fill="currentColor" xmlns="http://www.w3.org/2000/svg">
+                                <path fill-rule="evenodd" d="M2.678 11.894a1 1 0 0 1 .287.801 10.97 10.97 0 0 1-.398 2c1.395-.323 2.247-.697 2.634-.893a1 1 0 0 1 .71-.074A8.06 8.06 0 0 0 8 14c3.996 0 7-2.807 7-6 0-3.192-3.004-6-7-6S1 4.808 1 8c0 1.468.617 2.83 1.678 3.894zm-.493 3.905a21.682 21.682 0 0 1-.713.129c-.2.032-.352-.176-.273-.362a9.68 9.68 0 0 0 .244-.637l.003-.01c.248-.72.45-1.548.524-2.319C.743 11.37 0 9.76 0 8c0-3.866 3.582-7 8-7s8 3.134 8 7-3.582 7-8 7a9.06 9.06 0 0 1-2.347-.306c-.52.263-1.639.742-3.468 1.105z"/>
+                            </svg>
+                        </div>&nbsp;
+                        <div style="padding: 7px 0px;" class="cmt-count">${parseInt(post.comment_count)}</div>
+                    </div>
+                    <div class="save" data-post_id="${parseInt(post.id)}">
+                        <div class="svg-span"></div>
+                    </div>
+                </div>
+            </div>
+        </div>
+        <div class="comment-div" style="display: none;" data-post_id="${parseInt(post.id)}">
+            <div class="spinner-div">
+                <img src="${document.querySelector('#spinner').getAttribute('src')}" id="spinner" height="65px">
+            </div>
+            ${comment_form}
+        </div>`;
+    // Image URLs and the text are set as properties so that nothing in them is parsed as markup.
+    let pictures = card.querySelectorAll('.small-profilepic');
+    pictures[0].style.backgroundImage = `url("${post.creater.profile_pic}")`;
+    if(pictures[1]) {
+        pictures[1].style.backgroundImage = `url("${viewer.dataset.profile_pic}")`;
+    }
+    card.querySelector('.post-content').innerText = post.text;
+    if(post.image) {
+        let image = card.querySelector('.post-image');
+        image.style.backgroundImage = `url("${post.image}")`;
+        image.style.display = 'block';
+    }
+    show_like(card.querySelector('.like'), post.liked, post.like_count);
+    show_save(card.querySelector('.save'), post.saved);
+    return card;
+}
@@ -0,0 +1,50 @@
+"""
+Static file storage and serving.
+
+collectstatic with MinifiedStaticFilesStorage minifies the JavaScript and
+CSS as it copies them, then, as WhiteNoise's compressed manifest storage,
+gives every file a name carrying a hash of its content, rewrites the
+references between files, and writes gzip and Brotli copies next to each
+one. `{% static %}` resolves names through the manifest, so a changed file
+gets a new URL and StaticFilesMiddleware can let browsers keep each URL for
+a year without asking again.
+"""
+import os
+
+import rcssmin
+import rjsmin
+from django.core.files.base import ContentFile
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+MINIFIERS = {
+    '.js': rjsmin.jsmin,
+    '.css': rcssmin.cssmin,
+}
+
+
+def minifier(name):
+    base, extension = os.path.splitext(name)
+    return None if base.endswith('.min') else MINIFIERS.get(extension)
+
+
+class MinifiedStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    def save(self, name, content, max_length=None):
+        # collectstatic copies each source file with save(); the hashed and
+        # compressed copies made afterwards are written with _save().
+        minify = minifier(name)
+        if minify is not None:
+            content = ContentFile(minify(content.read().decode()).encode())
+        return super().save(name, content, max_length)
+
+    def post_process(self, paths, dry_run=False, **options):
+        # Hash the minified copies in STATIC_ROOT rather than the sources.
+        paths = {name: (self, name) if minifier(name) else source for name, source in paths.items()}
+        yield from super().post_process(paths, dry_run, **options)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    # Hashed files are served with `immutable` and a max-age of a year, the
+    # longest lifetime caches are expected to honour.
+    FOREVER = 365 * 24 * 60 * 60
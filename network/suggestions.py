@@ -0,0 +1,69 @@
+"""
+"Who to follow" suggestions for the sidebar.
+
+Instead of sorting the whole user table randomly on every request, a pool of
+candidate ids is sampled from random points of the primary key range and
+shared through the cache for SUGGESTIONS_POOL_TTL seconds. Each user's
+suggestions are drawn from that pool, friends of friends first, and cached
+for SUGGESTIONS_TTL seconds.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Min
+
+from .follows import followee_ids
+from .models import Follow, User
+
+
+POOL_KEY = 'suggestions:pool'
+
+
+def _user_key(user):
+    return f'suggestions:user:{user.pk}'
+
+
+def candidate_pool():
+    pool = cache.get(POOL_KEY)
+    if pool is None:
+        pool = sample_pool(settings.SUGGESTIONS_POOL_SIZE)
+        cache.set(POOL_KEY, pool, settings.SUGGESTIONS_POOL_TTL)
+    return pool
+
+
+def sample_pool(size):
+    bounds = User.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+    users = User.objects.filter(is_active=True)
+    span = bounds['high'] - bounds['low'] + 1
+    if span > size * 2:
+        # Oversample to make up for gaps left by deleted users.
+        users = users.filter(pk__in=random.sample(range(bounds['low'], bounds['high'] + 1), size * 2))
+    ids = list(users.values_list('pk', flat=True))
+    random.shuffle(ids)
+    return ids[:size]
+
+
+def for_user(user, count=6):
+    key = _user_key(user)
+    suggestions = cache.get(key)
+    if suggestions is None:
+        candidates = [pk for pk in candidate_pool() if pk != user.pk]
+        followed = set(followee_ids(user).filter(followee__in=candidates))
+        candidates = [pk for pk in random.sample(candidates, len(candidates)) if pk not in followed]
+        # How many of the people the user follows follow each candidate.
+        mutual = dict(
+            Follow.objects.filter(follower__in=followee_ids(user), followee__in=candidates)
+            .values_list('followee').annotate(count=Count('*')).order_by()
+        )
+        chosen = sorted(candidates, key=lambda pk: -mutual.get(pk, 0))[:count]
+        users = User.objects.in_bulk(chosen)
+        suggestions = [users[pk] for pk in chosen if pk in users]
+        cache.set(key, suggestions, settings.SUGGESTIONS_TTL)
+    return suggestions
+
+
+def invalidate(user):
+    cache.delete(_user_key(user))
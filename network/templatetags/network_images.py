@@ -0,0 +1,12 @@
+from django import template
+
+from network import images
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_url(field_file, variants, width):
+    """{% image_url post.content_image post.content_image_variants 640 %}"""
+    return images.pick(field_file, variants, width)
@@ -1,3 +1,909 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from PIL import Image
+
+from . import admission, backends, blobs, counters, fragments, images, interactions, search, suggestions
+from .models import Blob, Post, TimelineEntry, User
+
+
+# "SCAN t" walks the whole table; "SCAN t USING INDEX i" walks an index in
+# order and is stopped by the LIMIT every feed query carries.
+FULL_SCAN = re.compile(r'SCAN (?!\S+ USING (COVERING )?INDEX )')
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class QueryPlanTests(TestCase):
+    """
+    Every SELECT issued by the feed and comment views must be answered from
+    an index: no full table scan and no temporary B-tree to sort or group.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.authors = [User.objects.create_user(f'author{i}', password='password') for i in range(3)]
+        for author in cls.authors:
+            interactions.follow(cls.viewer, author)
+        interactions.follow(cls.authors[1], cls.authors[0])
+        interactions.follow(cls.authors[2], cls.authors[1])
+        # 12 posts each, so every profile has a second page.
+        for i in range(36):
+            cls.post = interactions.create_post(cls.authors[i % 3], f'Post number {i}', None)
+        for i in range(15):
+            interactions.add_comment(cls.viewer, cls.post.id, f'Comment number {i}')
+        interactions.like(cls.viewer, cls.post.id)
+        interactions.save(cls.viewer, cls.post.id)
+
+    def setUp(self):
+        self.client.force_login(self.viewer)
+        # The sidebar's candidate pool is sampled rarely and cached; keep it out of the plans.
+        suggestions.for_user(self.viewer)
+
+    def assertIndexedPlans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                self.assertIsNone(FULL_SCAN.match(step), f"Full scan for {url}:\n{query['sql']}\n{plan}")
+                self.assertNotIn('TEMP B-TREE', step, f"Sort for {url}:\n{query['sql']}\n{plan}")
+        return response
+
+    def assertIndexedPages(self, url):
+        response = self.assertIndexedPlans(url)
+        cursor = response.context['posts'].next_cursor
+        self.assertTrue(cursor)
+        response = self.assertIndexedPlans(f'{url}?cursor={cursor}')
+        self.assertIndexedPlans(f"{url}?cursor={response.context['posts'].previous_cursor}")
+
+    def test_index(self):
+        self.assertIndexedPages('/')
+
+    def test_index_anonymous(self):
+        self.client.logout()
+        self.assertIndexedPages('/')
+
+    def test_profile(self):
+        self.assertIndexedPages('/author0')
+
+    def test_following(self):
+        self.assertIndexedPages('/n/following')
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=2)
+    def test_following_with_celebrities(self):
+        # author0 and author1 have two followers, so their posts are merged in at read time.
+        self.assertIndexedPages('/n/following')
+
+    def test_comments(self):
+        url = f'/n/post/{self.post.id}/comments'
+        response = self.assertIndexedPlans(url + '?limit=5')
+        cursor = response.json()['next_cursor']
+        self.assertTrue(cursor)
+        self.assertIndexedPlans(f'{url}?limit=5&cursor={cursor}')
+
+
+class FeedQueryCountTests(TestCase):
+    """Feed pages run the same queries however many posts they show."""
+
+    URLS = ('/', '/n/following', '/n/saved', '/author')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        interactions.follow(cls.viewer, cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.viewer)
+        suggestions.for_user(self.viewer)
+
+    def add_posts(self, count):
+        for number in range(count):
+            post = interactions.create_post(self.author, f'Post {number}', None)
+            interactions.like(self.viewer, post.id)
+            interactions.save(self.viewer, post.id)
+            interactions.add_comment(self.author, post.id, 'Comment')
+
+    def test_constant(self):
+        self.add_posts(1)
+        counts = {}
+        for url in self.URLS:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            counts[url] = len(queries)
+        # A full page.
+        self.add_posts(9)
+        for url in self.URLS:
+            with self.subTest(url=url), self.assertNumQueries(counts[url]):
+                self.assertEqual(len(self.client.get(url).context['posts']), 10)
+
+
+@override_settings(REQUEST_TIMING=True, REQUEST_TIMING_SLOW_MS=60000, REQUEST_TIMING_SLOW_QUERIES=1000)
+class RequestTimingTests(TestCase):
+    def test_header(self):
+        timing = self.client.get('/')['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(timing, r'total;dur=[\d.]+')
+
+    @override_settings(REQUEST_TIMING_HEADER=False)
+    def test_header_off(self):
+        self.assertNotIn('Server-Timing', self.client.get('/'))
+
+    @override_settings(REQUEST_TIMING_SLOW_MS=0)
+    def test_slow_request_logged(self):
+        with self.assertLogs('network.timing', 'WARNING') as logs:
+            self.client.get('/')
+        self.assertIn('Slow request GET / -> 200', logs.output[0])
+
+    def test_fast_request_not_logged(self):
+        with self.assertNoLogs('network.timing', 'WARNING'):
+            self.client.get('/')
+
+
+@override_settings(
+    AUTH_USER_CACHE_TTL=300, AUTHENTICATION_BACKENDS=['network.backends.CachedModelBackend'],
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+)
+class CachedUserTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.viewer)
+
+    def signed_in(self):
+        return self.client.get('/').context['user']
+
+    def test_cache_hit(self):
+        # Search with no terms runs no queries of its own.
+        self.client.get('/n/search')
+        with self.assertNumQueries(0):
+            self.client.get('/n/search')
+
+    def test_forget(self):
+        self.signed_in()
+        User.objects.filter(pk=self.viewer.pk).update(first_name='Ada', profile_pic='blobs/new.jpg')
+        self.assertEqual(self.signed_in().first_name, '')
+        backends.forget(self.viewer.pk)
+        user = self.signed_in()
+        self.assertEqual((user.first_name, user.profile_pic.name), ('Ada', 'blobs/new.jpg'))
+
+    def test_saved_user_forgotten(self):
+        self.signed_in()
+        self.viewer.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.viewer.save(update_fields=['username'])
+        self.assertEqual(self.signed_in().username, 'renamed')
+
+    def test_password_change_signs_out(self):
+        self.signed_in()
+        self.viewer.set_password('changed')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.viewer.save(update_fields=['password'])
+        self.assertFalse(self.signed_in().is_authenticated)
+
+
+class CounterTests(TestCase):
+    """The denormalized counters stay equal to the rows they count."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        cls.post = interactions.create_post(cls.author, 'Hello', None)
+
+    def test_edit_keeps_concurrent_likes(self):
+        save = Post.save
+
+        def like_then_save(post, *args, **kwargs):
+            # A like that commits between the edit's read and its write.
+            interactions.like(self.viewer, post.pk)
+            return save(post, *args, **kwargs)
+
+        self.client.force_login(self.author)
+        with mock.patch.object(Post, 'save', like_then_save):
+            response = self.client.post(f'/n/post/{self.post.id}/edit', {'id': self.post.id, 'text': 'Edited', 'img_change': 'false'})
+        self.assertEqual(response.status_code, 200)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.content_text, self.post.like_count), ('Edited', 1))
+
+    def assertCountersMatch(self):
+        for post in Post.objects.all():
+            self.assertEqual(
+                (post.like_count, post.save_count, post.comment_count),
+                (post.likers.count(), post.savers.count(), post.comments.count()),
+            )
+        for user in User.objects.all():
+            self.assertEqual(
+                (user.follower_count, user.following_count, user.post_count),
+                (user.follower_edges.count(), user.following_edges.count(), user.posts.count()),
+            )
+
+    def test_toggles(self):
+        for _ in range(2):
+            interactions.like(self.viewer, self.post.id)
+            interactions.save(self.viewer, self.post.id)
+            interactions.follow(self.viewer, self.author)
+        interactions.add_comment(self.viewer, self.post.id, 'Hi')
+        self.assertCountersMatch()
+        for _ in range(2):
+            interactions.unlike(self.viewer, self.post.id)
+            interactions.unfollow(self.viewer, self.author)
+        other = interactions.create_post(self.author, 'Bye', None)
+        interactions.delete_post(other)
+        self.assertCountersMatch()
+
+    def test_reconcile(self):
+        interactions.like(self.viewer, self.post.id)
+        self.assertEqual(counters.reconcile(), {'Post': 0, 'User': 0})
+        version = Post.objects.get(pk=self.post.pk).version
+
+        Post.objects.filter(pk=self.post.pk).update(like_count=5, comment_count=2)
+        User.objects.filter(pk=self.author.pk).update(follower_count=3)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertCountersMatch()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).version, version + 1)
+        self.assertEqual(counters.reconcile(), {'Post': 0, 'User': 0})
+
+
+class FollowMigrationTests(TransactionTestCase):
+    """0020 and 0021 turn Follower rows into Follow edges and fill the counters."""
+
+    migrate_from = ('network', '0019_timelineentry')
+    migrate_to = ('network', '0021_follow_edges')
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('network'))
+
+    def test_follower_rows(self):
+        apps = self.migrate(self.migrate_from)
+        User = apps.get_model('network', 'User')
+        Follower = apps.get_model('network', 'Follower')
+        author, fan, other = (User.objects.create(username=name) for name in ('author', 'fan', 'other'))
+        # `fan` and `other` follow `author`; `author` follows `fan`.
+        Follower.objects.create(user=author).followers.set([fan, other])
+        Follower.objects.create(user=fan).followers.set([author])
+        Follower.objects.create(user=other)
+
+        apps = self.migrate(self.migrate_to)
+        Follow = apps.get_model('network', 'Follow')
+        self.assertEqual(
+            set(Follow.objects.values_list('follower__username', 'followee__username')),
+            {('fan', 'author'), ('other', 'author'), ('author', 'fan')},
+        )
+        counts = apps.get_model('network', 'User').objects.values_list('username', 'follower_count', 'following_count')
+        self.assertEqual(set(counts), {('author', 2, 1), ('fan', 1, 1), ('other', 0, 1)})
+
+
+class SuggestionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        friends = [User.objects.create_user(f'friend{number}', password='password') for number in range(2)]
+        cls.popular = User.objects.create_user('popular', password='password')
+        cls.known = User.objects.create_user('known', password='password')
+        cls.strangers = [User.objects.create_user(f'stranger{number}', password='password') for number in range(3)]
+        for friend in friends:
+            interactions.follow(cls.viewer, friend)
+            interactions.follow(friend, cls.popular)
+        interactions.follow(friends[0], cls.known)
+        # Who follows the viewer doesn't matter.
+        interactions.follow(cls.strangers[0], cls.viewer)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_ranked(self):
+        suggested = suggestions.for_user(self.viewer, count=10)
+        self.assertEqual(suggested[:2], [self.popular, self.known])
+        self.assertCountEqual(suggested[2:], self.strangers)
+
+    def test_follow_invalidates(self):
+        suggestions.for_user(self.viewer, count=10)
+        interactions.follow(self.viewer, self.popular)
+        self.assertEqual(suggestions.for_user(self.viewer, count=10)[0], self.known)
+
+
+@override_settings(TIMELINE_FANOUT_THRESHOLD=2)
+class TimelineTests(TestCase):
+    """Posts stay in the following feed as their author crosses the fan-out threshold."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password')
+        cls.followers = [User.objects.create_user(f'follower{i}', password='password') for i in range(2)]
+        for follower in cls.followers:
+            interactions.follow(follower, cls.author)
+        # Written while the author is over the threshold, so not fanned out.
+        cls.post = interactions.create_post(User.objects.get(pk=cls.author.pk), 'Hello', None)
+
+    def following(self):
+        self.client.force_login(self.followers[0])
+        return [post.id for post in self.client.get('/n/following').context['posts']]
+
+    def test_unfollow(self):
+        self.assertEqual(self.following(), [self.post.id])
+        interactions.unfollow(self.followers[1], self.author)
+        self.assertEqual(self.following(), [self.post.id])
+
+    def test_batch_unfollow(self):
+        interactions.apply_batch(self.followers[1], [{'action': 'unfollow', 'username': 'author'}])
+        self.assertEqual(self.following(), [self.post.id])
+
+    def test_stale_author(self):
+        # As request.user loaded before the follows, e.g. from the user cache.
+        self.author.follower_count = 0
+        post = interactions.create_post(self.author, 'Again', None)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+
+
+class MetricsTests(TestCase):
+    def test_token(self):
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/n/metrics').status_code, 403)
+            response = self.client.get('/n/metrics', headers={'Authorization': 'Bearer secret'})
+            self.assertContains(response, 'http_requests_total')
+        with override_settings(METRICS_TOKEN='', DEBUG=False):
+            self.assertEqual(self.client.get('/n/metrics').status_code, 403)
+
+    def test_username(self):
+        User.objects.create_user('metrics', password='password')
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        with open(os.path.join(media.name, 'file.txt'), 'wb') as file:
+            file.write(b'0123456789')
+
+    def get(self, byte_range):
+        response = self.client.get('/media/file.txt', headers={'Range': byte_range})
+        return response.status_code, b''.join(getattr(response, 'streaming_content', []))
+
+    def test_ranges(self):
+        self.assertEqual(self.get('bytes=2-4'), (206, b'234'))
+        self.assertEqual(self.get('bytes=-3'), (206, b'789'))
+        self.assertEqual(self.get('bytes=5-2'), (200, b'0123456789'))
+        self.assertEqual(self.get('bytes=10-'), (416, b''))
+
+    def test_routes_before_media(self):
+        self.assertEqual(resolve('/media/follow').url_name, 'followuser')
+        self.assertEqual(resolve('/media/file.txt').url_name, 'media')
+
+
+class BatchInteractionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        cls.post = interactions.create_post(cls.author, 'Hello', None)
+
+    def batch(self, *operations):
+        self.client.force_login(self.viewer)
+        return self.client.post('/n/interactions', {'operations': list(operations)}, content_type='application/json')
+
+    def test_coalesced(self):
+        response = self.batch(
+            {'action': 'like', 'post_id': self.post.id}, {'action': 'unlike', 'post_id': self.post.id},
+            {'action': 'like', 'post_id': self.post.id}, {'action': 'save', 'post_id': self.post.id},
+            {'action': 'follow', 'username': 'author'}, {'action': 'unfollow', 'username': 'author'},
+            {'action': 'follow', 'username': 'author'},
+        )
+        self.assertEqual(response.status_code, 200)
+        state = response.json()
+        self.assertEqual(state['posts'], [{'id': self.post.id, 'liked': True, 'saved': True, 'like_count': 1, 'save_count': 1}])
+        self.assertEqual(state['users'], [{'username': 'author', 'following': True, 'follower_count': 1}])
+        self.assertEqual(state['following_count'], 1)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.likers.count()), (1, 1))
+
+        state = self.batch({'action': 'unlike', 'post_id': self.post.id}, {'action': 'unfollow', 'username': 'author'}).json()
+        self.assertEqual((state['posts'][0]['like_count'], state['users'][0]['follower_count'], state['following_count']), (0, 0, 0))
+
+    def test_unknown_targets_skipped(self):
+        state = self.batch(
+            {'action': 'like', 'post_id': self.post.id + 100}, {'action': 'follow', 'username': 'nobody'},
+            {'action': 'like', 'post_id': self.post.id},
+        ).json()
+        self.assertEqual([post['id'] for post in state['posts']], [self.post.id])
+        self.assertEqual(state['users'], [])
+
+    def test_malformed(self):
+        for operation in ({'action': 'like', 'post_id': '1'}, {'action': 'like', 'post_id': 99999999999999999999999},
+                          {'action': 'like', 'post_id': 0}, {'action': 'follow'}, {'action': 'poke'}):
+            with self.subTest(operation=operation):
+                self.assertEqual(self.batch(operation).status_code, 400)
+        self.assertFalse(self.post.likers.exists())
+
+    def test_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.viewer)
+        body = {'operations': [{'action': 'like', 'post_id': self.post.id}]}
+        # A cross-site form can send this without a preflight.
+        response = client.post('/n/interactions', json.dumps(body), content_type='text/plain')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.post.likers.exists())
+
+        token = client.get('/').context['csrf_token']
+        response = client.post('/n/interactions', body, content_type='application/json', headers={'X-CSRFToken': str(token)})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.post.likers.exists())
+
+    def test_retried_after_conflict(self):
+        toggle = interactions._toggle_post_rows
+        conflicts = []
+
+        def conflict_once(*args):
+            toggle(*args)
+            if not conflicts:
+                # As if a concurrent request had inserted the same row first.
+                conflicts.append(True)
+                raise IntegrityError
+
+        with mock.patch.object(interactions, '_toggle_post_rows', conflict_once):
+            state = interactions.apply_batch(self.viewer, [{'action': 'like', 'post_id': self.post.id}])
+        self.assertEqual(conflicts, [True])
+        self.assertEqual(state['posts'][0]['like_count'], 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+
+@override_settings(WRITE_RATE_USER=0.01, WRITE_BURST_USER=2, WRITE_RATE_GLOBAL=0.01, WRITE_BURST_GLOBAL=100)
+class AdmissionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.post = interactions.create_post(cls.viewer, 'Hello', None)
+
+    def setUp(self):
+        # The buckets are built from the settings on first use.
+        self.enterContext(mock.patch.object(admission, '_limits', None))
+        self.client.force_login(self.viewer)
+
+    def like(self):
+        return self.client.put(f'/n/post/{self.post.id}/like')
+
+    def test_user_burst(self):
+        self.assertEqual([self.like().status_code for _ in range(2)], [204, 204])
+        response = self.like()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.client.get(f'/n/post/{self.post.id}/comments').status_code, 200)
+
+    @override_settings(WRITE_BURST_GLOBAL=1)
+    def test_global_bucket(self):
+        self.assertEqual(self.like().status_code, 204)
+        self.assertEqual(self.like().status_code, 503)
+
+    @override_settings(WRITE_CONCURRENCY=0, WRITE_QUEUE=0)
+    def test_full_queue(self):
+        response = self.like()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(self.post.likers.exists())
+
+    def test_database_locked(self):
+        response = admission.error_response(OperationalError('database is locked'))
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '2'))
+        self.assertEqual(admission.error_response(OperationalError('no such table')).status_code, 500)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password')
+
+    def hits(self, query, kind=None):
+        return search.search(query, kind)[0]
+
+    def test_index_follows_writes(self):
+        post = interactions.create_post(self.author, 'Espresso tasting tonight', None)
+        comment = interactions.add_comment(self.author, post.id, 'Bring cardamom')
+        self.assertEqual(self.hits('espresso'), [(search.POST, post.id)])
+        self.assertEqual(self.hits('cardamom'), [(search.COMMENT, comment.id)])
+
+        self.client.force_login(self.author)
+        self.client.post(f'/n/post/{post.id}/edit', {'id': post.id, 'text': 'Matcha tasting tonight', 'img_change': 'false'})
+        self.assertEqual(self.hits('espresso'), [])
+        self.assertEqual(self.hits('matcha'), [(search.POST, post.id)])
+
+        self.author.last_name = 'Lovelace'
+        self.author.save(update_fields=['last_name'])
+        self.assertEqual(self.hits('lovelace'), [(search.USER, self.author.id)])
+
+        interactions.delete_post(post)
+        self.assertEqual(self.hits('matcha'), [])
+        self.assertEqual(self.hits('cardamom'), [])
+
+    def test_names_rank_first(self):
+        interactions.create_post(self.author, 'Barista tips for beginners', None)
+        barista = User.objects.create_user('barista', password='password')
+        self.assertEqual(self.hits('barista')[0], (search.USER, barista.id))
+        self.assertEqual(len(self.hits('barista')), 2)
+        self.assertEqual(self.hits('barista', 'post')[0][0], search.POST)
+
+    def test_prefix(self):
+        post = interactions.create_post(self.author, 'Espresso tasting', None)
+        self.assertEqual(self.hits('espr'), [(search.POST, post.id)])
+        self.assertEqual(self.hits('tasting espr'), [(search.POST, post.id)])
+        self.assertEqual(self.hits('espr tasting'), [])
+
+    def test_cursor(self):
+        for number in range(5):
+            interactions.create_post(self.author, 'coffee ' * (number + 1), None)
+        everything, _ = search.search('coffee', limit=10)
+        pages, cursor = [], None
+        while True:
+            hits, cursor = search.search('coffee', cursor=cursor, limit=2)
+            pages += hits
+            if cursor is None:
+                break
+        self.assertEqual(len(everything), 5)
+        self.assertEqual(pages, everything)
+
+    def test_unsearched_saves_skipped(self):
+        post = interactions.create_post(self.author, 'Hello', None)
+        with mock.patch.object(search, 'index') as index:
+            interactions.like(self.author, post.id)
+            interactions.follow(User.objects.create_user('other', password='password'), self.author)
+            self.author.refresh_from_db()
+            self.author.save(update_fields=['last_login'])
+            self.author.save(update_fields=['follower_count', 'post_count'])
+            post.save(update_fields=['version'])
+            index.reset_mock()
+            self.author.save(update_fields=['bio'])
+            post.save(update_fields=['content_text'])
+        self.assertEqual([call.args[0] for call in index.call_args_list], [search.USER, search.POST])
+
+
+class ConditionalGetTests(TestCase):
+    """Repeat loads with a matching validator get a 304, until what they show changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        interactions.follow(cls.viewer, cls.author)
+        cls.post = interactions.create_post(cls.author, 'Hello', None)
+        interactions.add_comment(cls.viewer, cls.post.id, 'First')
+        interactions.save(cls.viewer, cls.post.id)
+
+    def setUp(self):
+        self.client.force_login(self.viewer)
+
+    def assertRevalidates(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        headers = {'If-None-Match': response['ETag']}
+        self.assertEqual(self.client.get(url, headers=headers).status_code, 304)
+        change()
+        self.assertEqual(self.client.get(url, headers=headers).status_code, 200)
+
+    def test_feeds(self):
+        for url in ('/', '/n/following', '/author', '/n/saved', '/n/feed?feed=all'):
+            with self.subTest(url=url):
+                self.assertRevalidates(url, lambda: interactions.add_comment(self.author, self.post.id, 'Again'))
+
+    def test_edited_post(self):
+        def edit():
+            self.client.force_login(self.author)
+            self.client.post(f'/n/post/{self.post.id}/edit', {'id': self.post.id, 'text': 'Edited', 'img_change': 'false'})
+            self.client.force_login(self.viewer)
+        self.assertRevalidates('/', edit)
+
+    def test_avatar_replaced(self):
+        # As the background job that strips an avatar and generates its derivatives.
+        def replace_avatar(user):
+            replace_avatar.count += 1
+            return lambda: User.objects.filter(pk=user.pk).update(
+                profile_pic=f'blobs/{replace_avatar.count}.jpg', profile_pic_variants={'variants': []},
+            )
+        replace_avatar.count = 0
+
+        for url in ('/', '/n/following', '/author', '/n/saved', '/n/feed?feed=all', '/n/feed?feed=following'):
+            with self.subTest(url=url):
+                self.assertRevalidates(url, replace_avatar(self.author))
+        for url in ('/', f'/n/post/{self.post.id}/comments'):
+            with self.subTest(url=url, viewer=True):
+                self.assertRevalidates(url, replace_avatar(self.viewer))
+
+    def test_comments(self):
+        url = f'/n/post/{self.post.id}/comments'
+        self.assertRevalidates(url, lambda: interactions.add_comment(self.author, self.post.id, 'Second'))
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': response['Last-Modified']}).status_code, 304)
+
+
+@override_settings(COMMENTS_PAGE_SIZE=3, COMMENTS_MAX_PAGE_SIZE=5)
+class CommentPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.post = interactions.create_post(cls.viewer, 'Hello', None)
+        cls.comments = [interactions.add_comment(cls.viewer, cls.post.id, f'Comment {number}') for number in range(7)]
+
+    def setUp(self):
+        self.client.force_login(self.viewer)
+        self.url = f'/n/post/{self.post.id}/comments'
+
+    def test_limit(self):
+        for limit, count in (('0', 1), ('-5', 1), ('4', 4), ('1000000', 5)):
+            with self.subTest(limit=limit):
+                response = self.client.get(self.url, {'limit': limit})
+                self.assertEqual(len(response.json()['comments']), count)
+        for limit in ('abc', '2.5', ''):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.client.get(self.url, {'limit': limit}).status_code, 400)
+
+    def test_walk(self):
+        seen, sizes, params = [], [], {}
+        while True:
+            data = self.client.get(self.url, params).json()
+            self.assertEqual(set(data), {'comments', 'next_cursor'})
+            seen += [comment['id'] for comment in data['comments']]
+            sizes.append(len(data['comments']))
+            if data['next_cursor'] is None:
+                break
+            params = {'cursor': data['next_cursor']}
+        self.assertEqual(sizes, [3, 3, 1])
+        # Newest first.
+        self.assertEqual(seen, [comment.id for comment in reversed(self.comments)])
+
+
+class FeedTests(TestCase):
+    """/n/feed continues each feed page where the server-rendered one ends."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        interactions.follow(cls.viewer, cls.author)
+        cls.posts = [interactions.create_post(cls.author, f'Post {number}', None) for number in range(13)]
+        for post in cls.posts:
+            interactions.save(cls.viewer, post.id)
+        interactions.like(cls.viewer, cls.posts[-1].id)
+
+    def setUp(self):
+        self.client.force_login(self.viewer)
+
+    def test_continues_feeds(self):
+        for url, feed in (('/', 'feed=all'), ('/n/following', 'feed=following'),
+                          ('/n/saved', 'feed=saved'), ('/author', 'feed=profile&username=author')):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                cursor = first.context['posts'].next_cursor
+                response = self.client.get(f'/n/feed?{feed}&cursor={cursor}')
+                self.assertEqual(response.status_code, 200)
+                shown = [post.id for post in first.context['posts']]
+                rest = [post['id'] for post in response.json()['posts']]
+                self.assertEqual(shown + rest, [post.id for post in reversed(self.posts)])
+                self.assertIsNone(response.json()['next_cursor'])
+
+    def test_payload(self):
+        card = self.client.get('/n/feed?feed=all').json()['posts'][0]
+        self.assertEqual(card['id'], self.posts[-1].id)
+        self.assertEqual(card['creater']['username'], 'author')
+        self.assertEqual((card['like_count'], card['liked'], card['saved'], card['own']), (1, True, True, False))
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/n/feed?feed=saved').status_code, 403)
+        self.assertEqual(self.client.get('/n/feed?feed=all').status_code, 200)
+
+
+class CardCacheTests(TestCase):
+    """Feed cards reuse cached fragments until the post or its author changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password', first_name='Ada')
+        cls.post = interactions.create_post(cls.author, 'Hello', None)
+
+    def test_invalidation(self):
+        self.assertContains(self.client.get('/'), 'Hello')
+        self.assertIsNotNone(fragments.local().get(fragments.key(self.post)))
+
+        self.client.force_login(self.author)
+        self.client.post(f'/n/post/{self.post.id}/edit', {'id': self.post.id, 'text': 'Edited', 'img_change': 'false'})
+        self.assertContains(self.client.get('/'), 'Edited')
+
+        self.author.first_name = 'Grace'
+        self.author.save()
+        self.assertContains(self.client.get('/'), 'Grace')
+
+    def test_viewer_state(self):
+        self.client.get('/')
+        interactions.like(self.author, self.post.id)
+        self.client.force_login(self.author)
+        response = self.client.get('/')
+        self.assertContains(response, 'onclick="unlike_post(this)"')
+        self.assertContains(response, f'confirm_delete({self.post.id})')
+
+
+class StaticFilesTests(TestCase):
+    def test_collectstatic(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'network.staticfiles.MinifiedStaticFilesStorage'},
+        }):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            with open(os.path.join(root, 'staticfiles.json')) as manifest:
+                hashed = json.load(manifest)['paths']['network/layout.js']
+            self.assertRegex(hashed, r'^network/layout\.[0-9a-f]{12}\.js$')
+            source = os.path.join(os.path.dirname(__file__), 'static', 'network', 'layout.js')
+            self.assertLess(os.path.getsize(os.path.join(root, hashed)), os.path.getsize(source))
+            for suffix in ('.gz', '.br'):
+                self.assertTrue(os.path.exists(os.path.join(root, hashed + suffix)))
+
+
+def jpeg(size=(64, 48), **options):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', **options)
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(IMAGE_DERIVATIVES_EAGER=True, UPLOAD_MAX_SIZES={'picture': 4096})
+class UploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password')
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_login(self.author)
+
+    def test_rejected(self):
+        for picture, status in ((jpeg((2000, 2000), quality=100), 413), (SimpleUploadedFile('a.jpg', b'text'), 400)):
+            with self.subTest(status=status):
+                response = self.client.post('/n/createpost', {'text': 'Hi', 'picture': picture})
+                self.assertEqual(response.status_code, status)
+        self.assertFalse(Post.objects.exists())
+
+    def test_metadata_stripped(self):
+        exif = Image.Exif()
+        exif[0x010e] = 'Secret description'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/n/createpost', {'text': 'Hi', 'picture': jpeg(exif=exif.tobytes())})
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get()
+        self.assertTrue(post.content_image_variants['stripped'])
+        self.assertEqual(post.content_image_variants['source'], post.content_image.name)
+        with post.content_image.open('rb') as stored:
+            self.assertNotIn(b'Secret description', stored.read())
+
+
+@override_settings(IMAGE_DERIVATIVES_EAGER=True)
+class ImageDerivativeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password')
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_login(self.author)
+
+    def test_generated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/n/createpost', {'text': 'Hi', 'picture': jpeg((800, 600))})
+        post = Post.objects.get()
+        info = post.content_image_variants
+        self.assertEqual(info['source'], post.content_image.name)
+        self.assertEqual((info['width'], info['height']), (800, 600))
+        self.assertEqual([(variant['width'], variant['height']) for variant in info['variants']], [(320, 240), (640, 480)])
+        for variant in info['variants']:
+            self.assertTrue(default_storage.exists(variant['name']))
+        self.assertEqual(images.pick(post.content_image, info, 300), default_storage.url(info['variants'][0]['name']))
+        self.assertEqual(images.pick(post.content_image, info, 400), default_storage.url(info['variants'][1]['name']))
+        # Wider than every derivative.
+        self.assertEqual(images.pick(post.content_image, info, 1000), post.content_image.url)
+
+    def test_pick_falls_back(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/n/createpost', {'text': 'Hi', 'picture': jpeg()})
+        post = Post.objects.get()
+        # Smaller than the narrowest derivative, so there are none.
+        self.assertEqual(post.content_image_variants['variants'], [])
+        self.assertEqual(images.pick(post.content_image, post.content_image_variants, 64), post.content_image.url)
+        self.assertEqual(images.pick(post.content_image, {}, 64), post.content_image.url)
+        stale = {'source': 'other.jpg', 'variants': [{'width': 320, 'height': 240, 'name': 'other_320.webp'}]}
+        self.assertEqual(images.pick(post.content_image, stale, 64), post.content_image.url)
+        self.assertEqual(images.pick(self.author.profile_pic, {}, 64), '')
+
+
+@override_settings(IMAGE_DERIVATIVES_EAGER=True)
+class BlobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password')
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_login(self.author)
+
+    def post(self, picture):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/n/createpost', {'text': 'Hi', 'picture': picture})
+        return Post.objects.latest('pk')
+
+    def stored(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, filename), self.media)
+            for directory, _, filenames in os.walk(self.media) for filename in filenames
+        )
+
+    def test_deduplicated(self):
+        first, second = self.post(jpeg()), self.post(jpeg())
+        self.assertEqual(blobs.references(first, 'content_image'), blobs.references(second, 'content_image'))
+        self.assertTrue(all(blobs.is_blob(name) for name in blobs.references(first, 'content_image')))
+        self.assertEqual(set(Blob.objects.values_list('refs', flat=True)), {2})
+        self.assertEqual(self.stored(), sorted(Blob.objects.values_list('name', flat=True)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            interactions.delete_post(first)
+        self.assertEqual(set(Blob.objects.values_list('refs', flat=True)), {1})
+        with self.captureOnCommitCallbacks(execute=True):
+            interactions.delete_post(second)
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.stored(), [])
+
+    def test_edit_releases_replaced_image(self):
+        post = self.post(jpeg())
+        replaced = blobs.references(post, 'content_image')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/n/post/{post.pk}/edit', {
+                'id': post.pk, 'text': 'Edited', 'img_change': 'true', 'picture': jpeg((80, 60)),
+            })
+        self.assertEqual(response.status_code, 200)
+        post.refresh_from_db()
+        kept = blobs.references(post, 'content_image')
+        self.assertFalse(set(replaced) & set(kept))
+        self.assertEqual(self.stored(), sorted(kept))
+        self.assertEqual(sorted(Blob.objects.values_list('name', flat=True)), sorted(kept))
+
+    def test_collect_media_scan(self):
+        orphan = os.path.join(self.media, blobs.blob_name('0' * 64, '.jpg'))
+        os.makedirs(os.path.dirname(orphan))
+        open(orphan, 'wb').close()
+        output = StringIO()
+        call_command('collect_media', scan=True, grace=0, stdout=output)
+        self.assertIn("Deleted 1 unreferenced file(s).", output.getvalue())
+        self.assertEqual(self.stored(), [])
@@ -0,0 +1,126 @@
+"""
+Materialized home timelines for the `following` feed.
+
+New posts are written into a TimelineEntry row per follower when they are
+created (fan-out on write), so reading the feed is a range scan over one
+user's entries. Authors with more than TIMELINE_FANOUT_THRESHOLD followers
+are not fanned out; their posts are merged in at read time instead. When
+an author drops back below the threshold, their recent posts are copied
+into every follower's timeline, since reads stop merging them.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F
+
+from .feeds import card_fields, feed_queryset
+from .follows import follower_ids
+from .models import Follow, Post, TimelineEntry, User
+from .pagination import CursorPaginator
+
+
+def fanout_threshold():
+    return getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 10000)
+
+
+def is_celebrity(author):
+    # From the database: `author` may be request.user, cached by CachedModelBackend.
+    return User.objects.filter(pk=author.pk, follower_count__gte=fanout_threshold()).exists()
+
+
+def celebrities_followed_by(user):
+    return (
+        Follow.objects
+        .filter(follower=user, followee__follower_count__gte=fanout_threshold())
+        .values_list('followee', flat=True)
+    )
+
+
+def fan_out(post):
+    if is_celebrity(post.creater):
+        return
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(user_id=user_id, post=post, author_id=post.creater_id, date_created=post.date_created)
+        for user_id in follower_ids(post.creater).iterator()
+    ], batch_size=500, ignore_conflicts=True)
+
+
+def recent_posts(author):
+    posts = Post.objects.filter(creater=author).order_by('-date_created')[:getattr(settings, 'TIMELINE_BACKFILL', 200)]
+    return list(posts.values_list('id', 'date_created'))
+
+
+def backfill(user, author):
+    """Copy the recent posts of a newly followed `author` into `user`'s timeline."""
+    if is_celebrity(author):
+        return
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(user=user, post_id=post_id, author=author, date_created=date_created)
+        for post_id, date_created in recent_posts(author)
+    ], batch_size=500, ignore_conflicts=True)
+
+
+def demoted(author_ids):
+    """
+    Of `author_ids`, whose follower counts were each just decremented by one
+    in the current transaction, the ones that fell below the threshold.
+    """
+    return list(User.objects.filter(pk__in=author_ids, follower_count=fanout_threshold() - 1))
+
+
+def refill(author):
+    """Copy the recent posts of `author`, no longer merged in at read time, into every follower's timeline."""
+    posts = recent_posts(author)
+    followers = follower_ids(author).iterator()
+    while batch := list(islice(followers, 500)):
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=user_id, post_id=post_id, author=author, date_created=date_created)
+            for user_id in batch for post_id, date_created in posts
+        ], batch_size=500, ignore_conflicts=True)
+
+
+def prune(user, author):
+    TimelineEntry.objects.filter(user=user, author=author).delete()
+
+
+def rebuild(user):
+    TimelineEntry.objects.filter(user=user).delete()
+    for author in User.objects.filter(follower_edges__follower=user):
+        backfill(user, author)
+
+
+def following_sources(viewer):
+    sources = [TimelineEntry.objects.filter(user=viewer)]
+    # One source per author: each is a range scan of post_creater_date_idx
+    # already in feed order, where `creater IN (...)` would need a sort.
+    sources += [
+        Post.objects.filter(creater=author).annotate(post_id=F('id'))
+        for author in celebrities_followed_by(viewer)
+    ]
+    return sources
+
+
+def following_fingerprint(viewer, cursor, per_page=10):
+    """The keys, post versions and shown author fields of the rows following_page() would show."""
+    def shown(relation):
+        # The same names for the author's fields in every source.
+        return {f'author_{index}': F(lookup) for index, lookup in enumerate(card_fields(relation))}
+
+    sources = following_sources(viewer)
+    sources[0] = sources[0].annotate(version=F('post__version'), **shown('author'))
+    sources[1:] = [source.annotate(**shown('creater')) for source in sources[1:]]
+    return CursorPaginator(sources, per_page, keys=('date_created', 'post_id')).fingerprint(cursor, 'version', *shown('creater'))
+
+
+def following_page(viewer, cursor, per_page=10, scroll=False):
+    """
+    Return a CursorPage of feed posts for `viewer`'s following feed, merging
+    the materialized timeline with the posts of followed celebrities. With
+    `scroll`, the page comes from CursorPaginator.scroll().
+    """
+    paginator = CursorPaginator(following_sources(viewer), per_page, keys=('date_created', 'post_id'))
+    page = paginator.scroll(cursor) if scroll else paginator.page(cursor)
+
+    posts = feed_queryset(viewer, Post.objects.filter(pk__in=[row.post_id for row in page])).in_bulk()
+    page.object_list = [posts[row.post_id] for row in page if row.post_id in posts]
+    return page
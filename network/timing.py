@@ -0,0 +1,139 @@
+"""
+Per-request SQL, template and view timings.
+
+RequestTimingMiddleware records how many queries a request ran, the time
+spent in SQL, in rendering templates and below the middleware itself, and
+reports them in a `Server-Timing` header that browser dev tools display.
+Requests slower than REQUEST_TIMING_SLOW_MS, or running more than
+REQUEST_TIMING_SLOW_QUERIES queries, are logged with their most expensive
+statements, grouped so that repeated (N+1) queries stand out.
+
+With REQUEST_TIMING off the middleware removes itself at startup, so it
+costs nothing.
+"""
+import logging
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_timings', default=None)
+
+
+class Timings:
+    def __init__(self):
+        self.queries = []
+        self.sql = 0.0
+        self.template = 0.0
+        self.view = 0.0
+        self.rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # A database execute wrapper: see connection.execute_wrapper().
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - started
+            self.sql += elapsed
+            self.queries.append((sql, elapsed))
+
+    def header(self):
+        return ', '.join([
+            f'db;dur={self.sql * 1000:.1f};desc="{len(self.queries)} queries"',
+            f'tpl;dur={self.template * 1000:.1f}',
+            # Everything below the middleware: the view and the middleware after this one.
+            f'total;dur={self.view * 1000:.1f}',
+        ])
+
+    def top_queries(self, limit):
+        """The `limit` statements with the most total time, as (total, count, sql)."""
+        grouped = defaultdict(lambda: [0.0, 0])
+        for sql, elapsed in self.queries:
+            grouped[sql][0] += elapsed
+            grouped[sql][1] += 1
+        ranked = sorted(grouped.items(), key=lambda item: item[1][0], reverse=True)
+        return [(total, count, sql) for sql, (total, count) in ranked[:limit]]
+
+
+_render = Template.render
+
+
+def _timed_render(self, context):
+    timings = _current.get()
+    # {% include %} and {% extends %} render nested templates; only the outermost is timed.
+    if timings is None or timings.rendering:
+        return _render(self, context)
+    timings.rendering = True
+    started = perf_counter()
+    try:
+        return _render(self, context)
+    finally:
+        timings.template += perf_counter() - started
+        timings.rendering = False
+
+
+@contextmanager
+def measure():
+    timings = Timings()
+    token = _current.set(timings)
+    started = perf_counter()
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timings))
+            yield timings
+    finally:
+        timings.view = perf_counter() - started
+        _current.reset(token)
+
+
+class RequestTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        Template.render = _timed_render
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with measure() as timings:
+            response = self.get_response(request)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        with measure() as timings:
+            response = await self.get_response(request)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        if settings.REQUEST_TIMING_HEADER:
+            response['Server-Timing'] = timings.header()
+        if timings.view * 1000 >= settings.REQUEST_TIMING_SLOW_MS or len(timings.queries) > settings.REQUEST_TIMING_SLOW_QUERIES:
+            lines = [
+                f"Slow request {request.method} {request.get_full_path()} -> {response.status_code}: "
+                f"{timings.view * 1000:.0f} ms, {len(timings.queries)} queries in {timings.sql * 1000:.0f} ms, "
+                f"{timings.template * 1000:.0f} ms rendering templates"
+            ]
+            lines += [
+                f"  {total * 1000:8.1f} ms  x{count:<3} {sql}"
+                for total, count, sql in timings.top_queries(settings.REQUEST_TIMING_TOP_QUERIES)
+            ]
+            logger.warning('\n'.join(lines))
+        return response
@@ -0,0 +1,91 @@
+"""
+Size-limited image uploads.
+
+LimitedUploadHandler runs before Django's own upload handlers and counts
+the bytes of each file as they stream in. A file declared or found to be
+larger than its field's limit in UPLOAD_MAX_SIZES is skipped before any
+byte past the limit reaches memory or a temporary file. A request whose
+body exceeds UPLOAD_MAX_REQUEST_SIZE is answered with 400 without reading
+it, as Django does for DATA_UPLOAD_MAX_MEMORY_SIZE.
+
+Views then get their files through image(), which raises Rejected for a
+skipped file and otherwise checks the image header (format, width and
+height) without decoding any pixels. Decoding, resizing and stripping
+metadata happen later in the background (see network.images).
+"""
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from PIL import Image
+
+
+class Rejected(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def limit(field_name):
+    return settings.UPLOAD_MAX_SIZES.get(field_name, settings.UPLOAD_MAX_SIZE)
+
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):g} MB"
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    def reject(self, field_name, message):
+        if not hasattr(self.request, 'rejected_uploads'):
+            self.request.rejected_uploads = {}
+        self.request.rejected_uploads[field_name] = message
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > settings.UPLOAD_MAX_REQUEST_SIZE:
+            raise RequestDataTooBig(f"Request larger than {_megabytes(settings.UPLOAD_MAX_REQUEST_SIZE)}")
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.limit = limit(field_name)
+        if content_length is not None and content_length > self.limit:
+            self.too_large()
+
+    def too_large(self):
+        self.reject(self.field_name, f"File larger than {_megabytes(self.limit)}")
+        raise SkipFile
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.limit:
+            self.too_large()
+        return raw_data
+
+    def file_complete(self, file_size):
+        # The next handler builds the file.
+        return None
+
+
+def image(request, field_name):
+    """
+    Return the image uploaded as `field_name`, or None if there is none.
+    Raise Rejected if it was too large or its header does not describe an
+    image in UPLOAD_IMAGE_FORMATS within UPLOAD_MAX_DIMENSION pixels a side.
+    """
+    upload = request.FILES.get(field_name)
+    rejected = getattr(request, 'rejected_uploads', {})
+    if field_name in rejected:
+        raise Rejected(rejected[field_name], 413)
+    if upload is None:
+        return None
+    try:
+        # Image.open() only parses the header; the pixels are decoded on load().
+        with Image.open(upload) as picture:
+            fmt, (width, height) = picture.format, picture.size
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise Rejected("Not an image", 400)
+    finally:
+        upload.seek(0)
+    if fmt not in settings.UPLOAD_IMAGE_FORMATS:
+        raise Rejected(f"Unsupported image format {fmt}", 415)
+    if max(width, height) > settings.UPLOAD_MAX_DIMENSION:
+        raise Rejected(f"Image larger than {settings.UPLOAD_MAX_DIMENSION} pixels a side", 413)
+    return upload
@@ -1,10 +1,10 @@
+import re
 
-from django.urls import path
+from django.urls import path, re_path
 
 from django.conf import settings
-from django.conf.urls.static import static
 
-from . import views
+from . import media, metrics, views
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -14,6 +14,7 @@ urlpatterns = [
     path("<str:username>", views.profile, name='profile'),
     path("n/following", views.following, name='following'),
     path("n/saved", views.saved, name="saved"),
+    path("n/feed", views.feed, name="feed"),
     path("n/createpost", views.create_post, name="createpost"),
     path("n/post/<int:id>/like", views.like_post, name="likepost"),
     path("n/post/<int:id>/unlike", views.unlike_post, name="unlikepost"),
@@ -22,9 +23,14 @@ urlpatterns = [
     path("n/post/<int:post_id>/comments", views.comment, name="comments"),
     path("n/post/<int:post_id>/write_comment",views.comment, name="writecomment"),
     path("n/post/<int:post_id>/delete", views.delete_post, name="deletepost"),
+    path("n/interactions", views.batch_interactions, name="interactions"),
+    path("n/search", views.search_view, name="search"),
     path("<str:username>/follow", views.follow, name="followuser"),
     path("<str:username>/unfollow", views.unfollow, name="unfollowuser"),
     path("n/post/<int:post_id>/edit", views.edit_post, name="editpost")
 ]
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+if settings.MEDIA_SERVE:
+    urlpatterns.append(re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media.serve, name="media"))
 
+if settings.METRICS:
+    urlpatterns.append(path("n/metrics", metrics.metrics_view, name="metrics"))
@@ -1,34 +1,37 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.db import IntegrityError
+from django.db.models import F, OuterRef, Subquery
 from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
-from django.core.paginator import Paginator
 import json
 
+from .feeds import card_fields, feed_queryset, serialize_post
+from .pagination import CursorPaginator
+from . import admission, blobs, conditional, follows, fragments, images, interactions, search, suggestions, timeline, uploads
 from .models import *
 
 
 def index(request):
-    all_posts = Post.objects.all().order_by('-date_created')
-    paginator = Paginator(all_posts, 10)
-    page_number = request.GET.get('page')
-    if page_number == None:
-        page_number = 1
-    posts = paginator.get_page(page_number)
-    followings = []
-    suggestions = []
-    if request.user.is_authenticated:
-        followings = Follower.objects.filter(followers=request.user).values_list('user', flat=True)
-        suggestions = User.objects.exclude(pk__in=followings).exclude(username=request.user.username).order_by("?")[:6]
-    return render(request, "network/index.html", {
+    paginator = CursorPaginator(feed_queryset(request.user), 10)
+    suggested = suggestions.for_user(request.user) if request.user.is_authenticated else []
+    validator = conditional.etag(
+        request, request.user, paginator.fingerprint(request.GET.get('cursor'), 'version', *card_fields()), [candidate.pk for candidate in suggested],
+    )
+    if response := conditional.not_modified(request, validator):
+        return response
+    posts = paginator.page(request.GET.get('cursor'))
+    fragments.attach(posts)
+    return conditional.tag(render(request, "network/index.html", {
         "posts": posts,
-        "suggestions": suggestions,
+        "suggestions": suggested,
         "page": "all_posts",
         'profile': False
-    })
+    }), validator)
 
 
 def login_view(request):
@@ -62,8 +65,13 @@ def register(request):
         email = request.POST["email"]
         fname = request.POST["firstname"]
         lname = request.POST["lastname"]
-        profile = request.FILES.get("profile")
-        cover = request.FILES.get('cover')
+        try:
+            profile = uploads.image(request, "profile")
+            cover = uploads.image(request, 'cover')
+        except uploads.Rejected as e:
+            return render(request, "network/register.html", {
+                "message": str(e)
+            }, status=e.status)
 
         # Ensure password matches confirmation
         password = request.POST["password"]
@@ -84,7 +92,8 @@ def register(request):
             if cover is not None:
                 user.cover = cover           
             user.save()
-            Follower.objects.create(user=user)
+            images.schedule(user, 'profile_pic')
+            images.schedule(user, 'cover')
         except IntegrityError:
             return render(request, "network/register.html", {
                 "message": "Username already taken."
@@ -102,97 +111,133 @@ def profile(request, username):
     except User.DoesNotExist:
         return HttpResponse("User not found", status=404)
     
-    all_posts = Post.objects.filter(creater=user).order_by('-date_created')
-    paginator = Paginator(all_posts, 10)
-    page_number = request.GET.get('page')
-    if page_number == None:
-        page_number = 1
-    posts = paginator.get_page(page_number)
-    followings = []
-    suggestions = []
+    paginator = CursorPaginator(feed_queryset(request.user, Post.objects.filter(creater=user)), 10)
     follower = False
     if request.user.is_authenticated:
-        followings = Follower.objects.filter(followers=request.user).values_list('user', flat=True)
-        suggestions = User.objects.exclude(pk__in=followings).exclude(username=request.user.username).order_by("?")[:6]
-
-        follower_obj = Follower.objects.filter(user=user).first()
-        if follower_obj and request.user in follower_obj.followers.all():
-            follower = True
-    
-    follower_obj = Follower.objects.filter(user=user).first()
-    follower_count = follower_obj.followers.all().count() if follower_obj else 0
-    following_count = Follower.objects.filter(followers=user).count()
-    return render(request, 'network/profile.html', {
+        follower = follows.is_following(request.user, user)
+    suggested = suggestions.for_user(request.user) if request.user.is_authenticated else []
+    validator = conditional.etag(
+        request, request.user, paginator.fingerprint(request.GET.get('cursor'), 'version', *card_fields()), [candidate.pk for candidate in suggested],
+        user.pk, conditional.shown(user, 'cover', 'cover_variants', 'bio'),
+        user.post_count, user.follower_count, user.following_count, follower,
+    )
+    if response := conditional.not_modified(request, validator):
+        return response
+    posts = paginator.page(request.GET.get('cursor'))
+    fragments.attach(posts)
+
+    return conditional.tag(render(request, 'network/profile.html', {
         "username": user,
         "posts": posts,
-        "posts_count": all_posts.count(),
-        "suggestions": suggestions,
+        "posts_count": user.post_count,
+        "suggestions": suggested,
         "page": "profile",
         "is_follower": follower,
-        "follower_count": follower_count,
-        "following_count": following_count
-    })
+        "follower_count": user.follower_count,
+        "following_count": user.following_count
+    }), validator)
 
 def following(request):
     if request.user.is_authenticated:
-        following_user = Follower.objects.filter(followers=request.user).values('user')
-        all_posts = Post.objects.filter(creater__in=following_user).order_by('-date_created')
-        paginator = Paginator(all_posts, 10)
-        page_number = request.GET.get('page')
-        if page_number == None:
-            page_number = 1
-        posts = paginator.get_page(page_number)
-        followings = Follower.objects.filter(followers=request.user).values_list('user', flat=True)
-        suggestions = User.objects.exclude(pk__in=followings).exclude(username=request.user.username).order_by("?")[:6]
-        return render(request, "network/index.html", {
+        suggested = suggestions.for_user(request.user)
+        validator = conditional.etag(
+            request, request.user, timeline.following_fingerprint(request.user, request.GET.get('cursor')),
+            [candidate.pk for candidate in suggested],
+        )
+        if response := conditional.not_modified(request, validator):
+            return response
+        posts = timeline.following_page(request.user, request.GET.get('cursor'))
+        fragments.attach(posts)
+        return conditional.tag(render(request, "network/index.html", {
             "posts": posts,
-            "suggestions": suggestions,
+            "suggestions": suggested,
             "page": "following"
-        })
+        }), validator)
     else:
         return HttpResponseRedirect(reverse('login'))
 
 def saved(request):
     if request.user.is_authenticated:
-        all_posts = Post.objects.filter(savers=request.user).order_by('-date_created')
-
-        paginator = Paginator(all_posts, 10)
-        page_number = request.GET.get('page')
-        if page_number == None:
-            page_number = 1
-        posts = paginator.get_page(page_number)
-
-        followings = Follower.objects.filter(followers=request.user).values_list('user', flat=True)
-        suggestions = User.objects.exclude(pk__in=followings).exclude(username=request.user.username).order_by("?")[:6]
-        return render(request, "network/index.html", {
+        paginator = CursorPaginator(feed_queryset(request.user, Post.objects.filter(savers=request.user)), 10)
+        suggested = suggestions.for_user(request.user)
+        validator = conditional.etag(
+            request, request.user, paginator.fingerprint(request.GET.get('cursor'), 'version', *card_fields()), [candidate.pk for candidate in suggested],
+        )
+        if response := conditional.not_modified(request, validator):
+            return response
+        posts = paginator.page(request.GET.get('cursor'))
+        fragments.attach(posts)
+        return conditional.tag(render(request, "network/index.html", {
             "posts": posts,
-            "suggestions": suggestions,
+            "suggestions": suggested,
             "page": "saved"
-        })
+        }), validator)
     else:
         return HttpResponseRedirect(reverse('login'))
+
+def feed(request):
+    """
+    The page after `cursor` of a feed as JSON, for infinite scroll. `feed` is
+    all, following, saved or profile (of `username`).
+    """
+    name = request.GET.get('feed', 'all')
+    cursor = request.GET.get('cursor')
+    if name in ('following', 'saved') and not request.user.is_authenticated:
+        return HttpResponse("Login required", status=403)
+    if name == 'following':
+        fingerprint = timeline.following_fingerprint(request.user, cursor)
+    else:
+        if name == 'all':
+            posts = Post.objects.all()
+        elif name == 'saved':
+            posts = Post.objects.filter(savers=request.user)
+        elif name == 'profile':
+            posts = Post.objects.filter(creater__username=request.GET.get('username', ''))
+        else:
+            return HttpResponse("Invalid feed", status=400)
+        paginator = CursorPaginator(feed_queryset(request.user, posts), 10)
+        fingerprint = paginator.fingerprint(cursor, 'version', *card_fields())
+    validator = conditional.etag(request, request.user, name, request.GET.get('username'), fingerprint)
+    if response := conditional.not_modified(request, validator):
+        return response
+    if name == 'following':
+        page = timeline.following_page(request.user, cursor, scroll=True)
+    else:
+        page = paginator.scroll(cursor)
+    return conditional.tag(JsonResponse({
+        "posts": [serialize_post(post, request.user) for post in page],
+        "next_cursor": page.next_cursor
+    }), validator)
         
 
 
 @login_required
+@admission.limit_writes
 def create_post(request):
     if request.method == 'POST':
         text = request.POST.get('text')
-        pic = request.FILES.get('picture')
         try:
-            post = Post.objects.create(creater=request.user, content_text=text, content_image=pic)
+            pic = uploads.image(request, 'picture')
+        except uploads.Rejected as e:
+            return HttpResponse(str(e), status=e.status)
+        try:
+            interactions.create_post(request.user, text, pic)
             return HttpResponseRedirect(reverse('index'))
         except Exception as e:
-            return HttpResponse(str(e), status=500)
+            return admission.error_response(e)
     else:
         return HttpResponse("Method must be 'POST'", status=405)
 
 @login_required
 @csrf_exempt
+@admission.limit_writes
 def edit_post(request, post_id):
     if request.method == 'POST':
         text = request.POST.get('text')
-        pic = request.FILES.get('picture')
+        try:
+            pic = uploads.image(request, 'picture')
+        except uploads.Rejected as e:
+            return JsonResponse({"success": False, "error": str(e)}, status=e.status)
         img_chg = request.POST.get('img_change')
         post_id = request.POST.get('id')
         try:
@@ -201,9 +246,18 @@ def edit_post(request, post_id):
                 return JsonResponse({"success": False, "error": "Unauthorized"}, status=403)
             
             post.content_text = text
+            # Only the edited columns: the counters may have moved since the read.
+            changed = ['content_text', 'version']
+            replaced = []
             if img_chg != 'false':
+                replaced = blobs.references(post, 'content_image')
                 post.content_image = pic
-            post.save()
+                changed.append('content_image')
+            post.version = F('version') + 1
+            post.save(update_fields=changed)
+            if img_chg != 'false':
+                blobs.release(replaced)
+                images.schedule(post, 'content_image')
             
             post_text = post.content_text if post.content_text else False
             post_image = post.img_url() if post.content_image else False
@@ -216,168 +270,214 @@ def edit_post(request, post_id):
         except Post.DoesNotExist:
             return JsonResponse({"success": False, "error": "Post not found"}, status=404)
         except Exception as e:
+            if admission.is_busy(e):
+                return admission.error_response(e)
             return JsonResponse({"success": False, "error": str(e)}, status=500)
     else:
         return HttpResponse("Method must be 'POST'", status=405)
 
 @csrf_exempt
-def like_post(request, id):
-    if request.user.is_authenticated:
+@admission.limit_writes
+async def like_post(request, id):
+    user = await request.auser()
+    if user.is_authenticated:
         if request.method == 'PUT':
             try:
-                post = Post.objects.get(pk=id)
-                post.likers.add(request.user)
-                post.save()
+                await interactions.alike(user, id)
                 return HttpResponse(status=204)
             except Post.DoesNotExist:
                 return HttpResponse("Post not found", status=404)
             except Exception as e:
-                return HttpResponse(str(e), status=500)
+                return admission.error_response(e)
         else:
             return HttpResponse("Method must be 'PUT'", status=405)
     else:
         return HttpResponseRedirect(reverse('login'))
 
 @csrf_exempt
-def unlike_post(request, id):
-    if request.user.is_authenticated:
+@admission.limit_writes
+async def unlike_post(request, id):
+    user = await request.auser()
+    if user.is_authenticated:
         if request.method == 'PUT':
             try:
-                post = Post.objects.get(pk=id)
-                post.likers.remove(request.user)
-                post.save()
+                await interactions.aunlike(user, id)
                 return HttpResponse(status=204)
             except Post.DoesNotExist:
                 return HttpResponse("Post not found", status=404)
             except Exception as e:
-                return HttpResponse(str(e), status=500)
+                return admission.error_response(e)
         else:
             return HttpResponse("Method must be 'PUT'", status=405)
     else:
         return HttpResponseRedirect(reverse('login'))
 
 @csrf_exempt
-def save_post(request, id):
-    if request.user.is_authenticated:
+@admission.limit_writes
+async def save_post(request, id):
+    user = await request.auser()
+    if user.is_authenticated:
         if request.method == 'PUT':
             try:
-                post = Post.objects.get(pk=id)
-                post.savers.add(request.user)
-                post.save()
+                await interactions.asave(user, id)
                 return HttpResponse(status=204)
             except Post.DoesNotExist:
                 return HttpResponse("Post not found", status=404)
             except Exception as e:
-                return HttpResponse(str(e), status=500)
+                return admission.error_response(e)
         else:
             return HttpResponse("Method must be 'PUT'", status=405)
     else:
         return HttpResponseRedirect(reverse('login'))
 
 @csrf_exempt
-def unsave_post(request, id):
-    if request.user.is_authenticated:
+@admission.limit_writes
+async def unsave_post(request, id):
+    user = await request.auser()
+    if user.is_authenticated:
         if request.method == 'PUT':
             try:
-                post = Post.objects.get(pk=id)
-                post.savers.remove(request.user)
-                post.save()
+                await interactions.aunsave(user, id)
                 return HttpResponse(status=204)
             except Post.DoesNotExist:
                 return HttpResponse("Post not found", status=404)
             except Exception as e:
-                return HttpResponse(str(e), status=500)
+                return admission.error_response(e)
         else:
             return HttpResponse("Method must be 'PUT'", status=405)
     else:
         return HttpResponseRedirect(reverse('login'))
 
 @csrf_exempt
-def follow(request, username):
-    if request.user.is_authenticated:
+@admission.limit_writes
+async def follow(request, username):
+    viewer = await request.auser()
+    if viewer.is_authenticated:
         if request.method == 'PUT':
             try:
-                user = User.objects.get(username=username)
-                (follower, create) = Follower.objects.get_or_create(user=user)
-                follower.followers.add(request.user)
-                follower.save()
+                user = await User.objects.aget(username=username)
+                await interactions.afollow(viewer, user)
                 return HttpResponse(status=204)
             except User.DoesNotExist:
                 return HttpResponse("User not found", status=404)
             except Exception as e:
-                return HttpResponse(str(e), status=500)
+                return admission.error_response(e)
         else:
             return HttpResponse("Method must be 'PUT'", status=405)
     else:
         return HttpResponseRedirect(reverse('login'))
 
 @csrf_exempt
-def unfollow(request, username):
-    if request.user.is_authenticated:
+@admission.limit_writes
+async def unfollow(request, username):
+    viewer = await request.auser()
+    if viewer.is_authenticated:
         if request.method == 'PUT':
             try:
-                user = User.objects.get(username=username)
-                follower = Follower.objects.get(user=user)
-                follower.followers.remove(request.user)
-                follower.save()
+                user = await User.objects.aget(username=username)
+                await interactions.aunfollow(viewer, user)
                 return HttpResponse(status=204)
             except User.DoesNotExist:
                 return HttpResponse("User not found", status=404)
-            except Follower.DoesNotExist:
-                return HttpResponse("Follower relationship not found", status=404)
             except Exception as e:
-                return HttpResponse(str(e), status=500)
+                return admission.error_response(e)
         else:
             return HttpResponse("Method must be 'PUT'", status=405)
     else:
         return HttpResponseRedirect(reverse('login'))
 
+@admission.limit_writes
+async def batch_interactions(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        if request.method == 'POST':
+            try:
+                operations = json.loads(request.body).get('operations')
+                if not isinstance(operations, list) or len(operations) > settings.INTERACTIONS_BATCH_MAX:
+                    return HttpResponse(f"'operations' must be a list of at most {settings.INTERACTIONS_BATCH_MAX} toggles", status=400)
+                return JsonResponse(await interactions.aapply_batch(user, operations))
+            except (ValueError, AttributeError) as e:
+                return HttpResponse(str(e), status=400)
+            except Exception as e:
+                return admission.error_response(e)
+        else:
+            return HttpResponse("Method must be 'POST'", status=405)
+    else:
+        return HttpResponseRedirect(reverse('login'))
 
 @csrf_exempt
-def comment(request, post_id):
-    if request.user.is_authenticated:
+@admission.limit_writes
+async def comment(request, post_id):
+    user = await request.auser()
+    if user.is_authenticated:
         if request.method == 'POST':
             try:
                 data = json.loads(request.body)
                 comment_text = data.get('comment_text')
-                post = Post.objects.get(id=post_id)
-                newcomment = Comment.objects.create(
-                    post=post,
-                    commenter=request.user,
-                    comment_content=comment_text
-                )
-                post.comment_count += 1
-                post.save()
+                newcomment = await interactions.aadd_comment(user, post_id, comment_text)
                 return JsonResponse([newcomment.serialize()], safe=False, status=201)
             except Post.DoesNotExist:
                 return HttpResponse("Post not found", status=404)
             except Exception as e:
-                return HttpResponse(str(e), status=500)
+                return admission.error_response(e)
     
         try:
-            post = Post.objects.get(id=post_id)
-            comments = Comment.objects.filter(post=post).order_by('-comment_time').all()
-            return JsonResponse([comment.serialize() for comment in comments], safe=False)
-        except Post.DoesNotExist:
-            return JsonResponse([], safe=False)
+            limit = min(max(int(request.GET.get('limit', settings.COMMENTS_PAGE_SIZE)), 1), settings.COMMENTS_MAX_PAGE_SIZE)
+        except ValueError:
+            return HttpResponse("Invalid limit", status=400)
+        comments = Comment.objects.filter(post_id=post_id).select_related('commenter')
+        paginator = CursorPaginator(comments, limit, keys=('comment_time', 'id'))
+        # Comments are only ever added, so the count and the newest time
+        # identify the list; the commenters' names and avatars can change.
+        latest = Comment.objects.filter(post=OuterRef('pk')).order_by('-comment_time').values('comment_time')[:1]
+        state = await Post.objects.filter(pk=post_id).values_list('comment_count', Subquery(latest)).afirst()
+        validator = last_modified = None
+        if state is not None:
+            last_modified = state[1]
+            commenters = await sync_to_async(paginator.fingerprint)(request.GET.get('cursor'), *card_fields('commenter'))
+            validator = conditional.etag(request, user, post_id, *state, commenters)
+            if response := conditional.not_modified(request, validator, last_modified):
+                return response
+
+        page = await sync_to_async(paginator.scroll)(request.GET.get('cursor'))
+        response = JsonResponse({
+            "comments": [comment.serialize() for comment in page],
+            "next_cursor": page.next_cursor
+        })
+        return conditional.tag(response, validator, last_modified) if validator else response
     else:
         return HttpResponseRedirect(reverse('login'))
 
+def search_view(request):
+    kind = request.GET.get('type') or None
+    if kind is not None and kind not in search.KINDS:
+        return HttpResponse("Invalid type", status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', settings.SEARCH_PAGE_SIZE)), 1), settings.SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        return HttpResponse("Invalid limit", status=400)
+    hits, next_cursor = search.search(request.GET.get('q', ''), kind, request.GET.get('cursor'), limit)
+    return JsonResponse({
+        "results": search.load(hits, request.user),
+        "next_cursor": next_cursor
+    })
+
 @csrf_exempt
+@admission.limit_writes
 def delete_post(request, post_id):
     if request.user.is_authenticated:
         if request.method == 'PUT':
             try:
                 post = Post.objects.get(id=post_id)
-                if request.user == post.creater:
-                    post.delete()
+                if request.user.pk == post.creater_id:
+                    interactions.delete_post(post)
                     return HttpResponse(status=204)
                 else:
                     return HttpResponse("Unauthorized", status=403)
             except Post.DoesNotExist:
                 return HttpResponse("Post not found", status=404)
             except Exception as e:
-                return HttpResponse(str(e), status=500)
+                return admission.error_response(e)
         else:
             return HttpResponse("Method must be 'PUT'", status=405)
     else:
@@ -0,0 +1,86 @@
+"""
+Database profiles selected with the DATABASE_PROFILE environment variable.
+
+    sqlite        the plain development database, one connection per request
+    sqlite-tuned  WAL journal, synchronous=NORMAL, a busy timeout and mmap
+                  reads, applied to every new connection, with write
+                  transactions taking the lock up front; for several workers
+                  sharing one SQLite file
+    postgres      DATABASE_URL, with a psycopg connection pool (or persistent
+                  connections when DATABASE_POOL=False)
+"""
+import os
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+
+SQLITE_BUSY_TIMEOUT = 5  # seconds
+
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA temp_store=MEMORY',
+)
+
+
+def sqlite(name):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+
+
+def sqlite_tuned(name):
+    return {
+        **sqlite(name),
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(SQLITE_PRAGMAS),
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            # Take the write lock at BEGIN rather than on the first write, so a
+            # waiting writer is retried by busy_timeout instead of failing with
+            # "database is locked" when its read lock cannot be upgraded.
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+
+
+def postgres(url):
+    parts = urlsplit(url)
+    options = dict(parse_qsl(parts.query))
+    pooled = os.environ.get('DATABASE_POOL', 'True') == 'True'
+    if pooled:
+        options['pool'] = {
+            'min_size': int(os.environ.get('DATABASE_POOL_MIN', 2)),
+            'max_size': int(os.environ.get('DATABASE_POOL_MAX', 10)),
+            'timeout': int(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+        }
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': unquote(parts.path.lstrip('/')),
+        'USER': unquote(parts.username or ''),
+        'PASSWORD': unquote(parts.password or ''),
+        'HOST': parts.hostname or '',
+        'PORT': parts.port or '',
+        # The pool keeps connections open itself and cannot be combined with
+        # persistent connections.
+        'CONN_MAX_AGE': 0 if pooled else int(os.environ.get('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': not pooled,
+        'OPTIONS': options,
+    }
+
+
+def database(profile, sqlite_name):
+    if profile == 'sqlite':
+        return sqlite(sqlite_name)
+    if profile == 'sqlite-tuned':
+        return sqlite_tuned(sqlite_name)
+    if profile == 'postgres':
+        url = os.environ.get('DATABASE_URL')
+        if not url:
+            raise ValueError("DATABASE_PROFILE=postgres needs DATABASE_URL")
+        return postgres(url)
+    raise ValueError(f"Unknown DATABASE_PROFILE {profile!r}")
@@ -14,6 +14,8 @@ import os
 from pathlib import Path
 from django.contrib.messages import constants as messages
 
+from project4 import databases
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,8 +45,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'network.metrics.MetricsMiddleware',
+    'network.timing.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Add whitenoise for static files
+    'network.staticfiles.StaticFilesMiddleware',  # WhiteNoise, with a one-year lifetime for hashed files
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,18 +81,148 @@ WSGI_APPLICATION = 'project4.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# DATABASE_PROFILE is 'sqlite', 'sqlite-tuned' or 'postgres'; see
+# project4/databases.py. Setting DATABASE_URL selects 'postgres' by default.
+# Plain 'sqlite' leaves the checked-in development database file as it is
+# (sqlite-tuned switches it to WAL); deployments on SQLite select
+# 'sqlite-tuned' explicitly.
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'postgres' if os.environ.get('DATABASE_URL') else 'sqlite')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': databases.database(DATABASE_PROFILE, BASE_DIR / 'db.sqlite3'),
 }
 
 AUTH_USER_MODEL = "network.User"
 
+# Cache
+# CACHE_URL selects a cache shared by all workers: redis://host:6379/0 or
+# memcached://host:11211. Without it every process keeps its own in memory.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL.removeprefix('memcached://'),
+    }}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Sessions: 'db', 'cached_db' (the default with a shared cache: reads come from
+# the cache, writes go to both), 'cache' or 'signed_cookies' (no server-side
+# state, so logging out cannot revoke a copied cookie).
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('SESSION_BACKEND', 'cached_db' if CACHE_URL else 'db')
+
+# The signed-in user is loaded from the cache for AUTH_USER_CACHE_TTL seconds
+# (0 disables it; see network/backends.py). Both need a shared cache.
+# Sessions remember the backend that signed them in, so changing the TTL
+# between 0 and not 0 signs everyone out once.
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 300 if CACHE_URL else 0))
+AUTHENTICATION_BACKENDS = [
+    'network.backends.CachedModelBackend' if AUTH_USER_CACHE_TTL else 'django.contrib.auth.backends.ModelBackend',
+]
+
+# Rendered post card fragments (see network/fragments.py) are kept for
+# CARD_CACHE_TTL seconds in the cache, and the CARD_CACHE_LRU_SIZE most
+# recently used also in each process.
+CARD_CACHE = os.environ.get('CARD_CACHE', 'True') == 'True'
+CARD_CACHE_TTL = int(os.environ.get('CARD_CACHE_TTL', 86400))
+CARD_CACHE_LRU_SIZE = int(os.environ.get('CARD_CACHE_LRU_SIZE', 2000))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Following feed timelines: posts are copied into each follower's timeline
+# when created, except for authors with at least this many followers, whose
+# posts are merged in when the feed is read.
+TIMELINE_FANOUT_THRESHOLD = int(os.environ.get('TIMELINE_FANOUT_THRESHOLD', 10000))
+# Number of an author's recent posts copied into a timeline on follow.
+TIMELINE_BACKFILL = int(os.environ.get('TIMELINE_BACKFILL', 200))
+
+# "You might know" sidebar: size and lifetime (seconds) of the shared pool of
+# randomly sampled candidate users, and how long each user's picks are kept.
+SUGGESTIONS_POOL_SIZE = int(os.environ.get('SUGGESTIONS_POOL_SIZE', 200))
+SUGGESTIONS_POOL_TTL = int(os.environ.get('SUGGESTIONS_POOL_TTL', 300))
+SUGGESTIONS_TTL = int(os.environ.get('SUGGESTIONS_TTL', 60))
+
+# Comments returned per request by /n/post/<id>/comments (?limit= may ask
+# for up to COMMENTS_MAX_PAGE_SIZE).
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_MAX_PAGE_SIZE = 100
+
+# Search results returned per request by /n/search (?limit= may ask for up
+# to SEARCH_MAX_PAGE_SIZE).
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+
+# Most like/save/follow toggles accepted in one /n/interactions request.
+INTERACTIONS_BATCH_MAX = 100
+
+# Write admission control (see network/admission.py), per worker process:
+# token buckets per user (429 when empty) and overall (503), then at most
+# WRITE_CONCURRENCY writes in flight with WRITE_QUEUE more waiting up to
+# WRITE_QUEUE_TIMEOUT seconds (503 after that).
+WRITE_ADMISSION = os.environ.get('WRITE_ADMISSION', 'True') == 'True'
+WRITE_RATE_USER = float(os.environ.get('WRITE_RATE_USER', 5))
+WRITE_BURST_USER = int(os.environ.get('WRITE_BURST_USER', 20))
+WRITE_RATE_GLOBAL = float(os.environ.get('WRITE_RATE_GLOBAL', 200))
+WRITE_BURST_GLOBAL = int(os.environ.get('WRITE_BURST_GLOBAL', 400))
+WRITE_CONCURRENCY = int(os.environ.get('WRITE_CONCURRENCY', 4))
+WRITE_QUEUE = int(os.environ.get('WRITE_QUEUE', 64))
+WRITE_QUEUE_TIMEOUT = float(os.environ.get('WRITE_QUEUE_TIMEOUT', 2))
+
+# Resized copies generated in the background for uploaded images, by field.
+IMAGE_DERIVATIVE_WIDTHS = {
+    'content_image': (320, 640, 1280),
+    'profile_pic': (64, 128, 256),
+    'cover': (640, 1280),
+}
+IMAGE_DERIVATIVE_FORMAT = os.environ.get('IMAGE_DERIVATIVE_FORMAT', 'WEBP')
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_DERIVATIVE_WORKERS = 2
+# Generate derivatives on the request thread instead (useful in tests).
+IMAGE_DERIVATIVES_EAGER = os.environ.get('IMAGE_DERIVATIVES_EAGER', 'False') == 'True'
+
+# Uploads (see network/uploads.py): files are counted as they stream in and
+# skipped once past their field's limit, before reaching a temporary file.
+FILE_UPLOAD_HANDLERS = [
+    'network.uploads.LimitedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+MB = 1024 * 1024
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 5 * MB))
+UPLOAD_MAX_SIZES = {
+    'picture': UPLOAD_MAX_SIZE,
+    'cover': UPLOAD_MAX_SIZE,
+    'profile': int(os.environ.get('UPLOAD_MAX_PROFILE_SIZE', 2 * MB)),
+}
+# Multipart requests larger than this are refused without reading the body.
+UPLOAD_MAX_REQUEST_SIZE = int(os.environ.get('UPLOAD_MAX_REQUEST_SIZE', 2 * UPLOAD_MAX_SIZE + 3 * MB))
+UPLOAD_IMAGE_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+UPLOAD_MAX_DIMENSION = int(os.environ.get('UPLOAD_MAX_DIMENSION', 8000))
+# Quality of the re-encoded, metadata-free copy that replaces a JPEG or WebP upload.
+IMAGE_ORIGINAL_QUALITY = 90
+
+# Per-request query count and SQL, template and view time in a Server-Timing
+# header (see network/timing.py). Requests slower than REQUEST_TIMING_SLOW_MS
+# or running more than REQUEST_TIMING_SLOW_QUERIES queries are logged with
+# their REQUEST_TIMING_TOP_QUERIES most expensive statements.
+REQUEST_TIMING = os.environ.get('REQUEST_TIMING', str(DEBUG)) == 'True'
+REQUEST_TIMING_HEADER = os.environ.get('REQUEST_TIMING_HEADER', 'True') == 'True'
+REQUEST_TIMING_SLOW_MS = int(os.environ.get('REQUEST_TIMING_SLOW_MS', 500))
+REQUEST_TIMING_SLOW_QUERIES = int(os.environ.get('REQUEST_TIMING_SLOW_QUERIES', 30))
+REQUEST_TIMING_TOP_QUERIES = 5
+
+# Prometheus metrics at /n/metrics (see network/metrics.py). Scrapes must send
+# "Authorization: Bearer <METRICS_TOKEN>"; without a token the page is only
+# served with DEBUG on. Under gunicorn, set
+# METRICS_DIR to a directory shared by the workers and emptied on start.
+METRICS = os.environ.get('METRICS', 'True') == 'True'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -125,8 +259,34 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# With STATIC_MANIFEST (the default when not DEBUG), collectstatic writes
+# minified, content-hashed and precompressed files and templates link to
+# those (see network/staticfiles.py). Run collectstatic with the same value
+# the server uses.
+STATIC_MANIFEST = os.environ.get('STATIC_MANIFEST', str(not DEBUG)) == 'True'
+STORAGES = {
+    # Uploads and image derivatives, named by content (see network/blobs.py).
+    'default': {'BACKEND': 'network.blobs.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': (
+        'network.staticfiles.MinifiedStaticFilesStorage' if STATIC_MANIFEST
+        else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+    )},
+}
 MEDIA_ROOT = BASE_DIR / 'network' / 'media'
 MEDIA_URL = '/media/'
+# Seconds an unreferenced media file is kept before collect_media deletes it,
+# so uploads still being saved are left alone.
+MEDIA_GC_GRACE = int(os.environ.get('MEDIA_GC_GRACE', 3600))
+
+# Serve MEDIA_ROOT through network.media (set MEDIA_SERVE=False when the
+# front-end server maps MEDIA_URL itself).
+MEDIA_SERVE = os.environ.get('MEDIA_SERVE', 'True') == 'True'
+# Cache lifetime for uploads whose names are not content-hashed.
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 3600))
+# '' to stream from Django, 'nginx' for X-Accel-Redirect, 'apache' for X-Sendfile.
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD', '')
+# Internal nginx location aliased to MEDIA_ROOT, used with MEDIA_OFFLOAD='nginx'.
+MEDIA_OFFLOAD_PREFIX = os.environ.get('MEDIA_OFFLOAD_PREFIX', '/protected-media/')
 
 # Security settings for production
 if not DEBUG: